@@ -10,20 +10,6 @@ IMAGES = {
     'hive_contaminated': "Images/hive_contaminated.png"
 }
 
-# Use acute data only for short term effect (microgram)
-ld50_data = {
-    "honeybee": 0.0102,
-    "bumblebee": 0.014,
-    "solitary": 0.00386
-}
-
-# Controls how quickly the probability of lethality increases around the LD50 value
-steepness_dict = {
-    "honeybee": {"low": 1, "moderate": 2, "high": 4},
-    "bumblebee": {"low": 1.5, "moderate": 3, "high": 5},
-    "solitary": {"low": 1, "moderate": 2.5, "high": 4.5}
-}
-
 def hill_mortality(x, x50, n):
     """
     Hill function, return the proability of the effect
@@ -34,27 +20,34 @@ def hill_mortality(x, x50, n):
     return (x ** n) / (x ** n + x50 ** n)
 
 class BumbleBees(Agent):
+    type = 'bee'
+    image = IMAGES['bee']
+    image_contaminated = IMAGES['bee_contaminated']
+
     def __init__(self, 
                  model,
                  sensitivity, 
                  contaminated=False):
         super().__init__(model)
-        self.type = 'bee'
+        constants = self.model.parameters.agent_constants(self.model.species_id, sensitivity)
 
         # Health attributes
         self.pesticide_exposure = 0
         self.contaminated = contaminated
         self.sensitivity = sensitivity
-        self.energy = 400
-        self.energy_cost = 1
+        self.energy = constants['energy']
+        self.energy_cost = constants['energy_cost']
+        self.full_energy = constants['energy']
+        self.ld50 = constants['ld50']
+        self.steepness = constants['steepness']
 
         # Foraging attributes
         self.nectar = 0
-        self.max_nectar_capacity = 100
+        self.max_nectar_capacity = constants['max_nectar_capacity']
         
         # Basic Movement attributes
-        self.bee_sensing_radius = 1
-        self.speed = 3
+        self.bee_sensing_radius = constants['sensing_radius']
+        self.speed = constants['speed']
 
         # Trapline Movement attributes
         self.waypoints = None
@@ -64,10 +57,6 @@ class BumbleBees(Agent):
         self.hive = self.model.random.randint(1, self.model.num_hive)
         self.hive_object = None
         self.time_not_return_hive = 0
-
-        # Image attribute
-        self.image = IMAGES['bee']
-        self.image_contaminated = IMAGES['bee_contaminated']
         
     '''
     =================================
@@ -118,7 +107,7 @@ class BumbleBees(Agent):
             # Reset parameter once return to hive
             self.hive_object.food_source += self.nectar
             self.nectar = 0
-            self.energy = 400
+            self.energy = self.full_energy
             self.current_waypoint = 0
 
             # Contaminate hive
@@ -136,9 +125,7 @@ class BumbleBees(Agent):
             self.energy -= self.energy_cost
 
     def death(self):
-        probability = hill_mortality(x=self.pesticide_exposure, 
-                                                    x50=ld50_data[self.model.bee_type],
-                                                    n=steepness_dict[self.model.bee_type][self.sensitivity])
+        probability = hill_mortality(x=self.pesticide_exposure, x50=self.ld50, n=self.steepness)
         r = self.random.random()
         if r < probability:
             #print('random', r)
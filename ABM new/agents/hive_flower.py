@@ -11,33 +11,33 @@ IMAGES = {
 }
 
 class Flower(Agent):
+    # The type tag and image paths of every agent class are class attributes,
+    # shared by all instances instead of stored per agent
+    type = 'flower'
+    image = IMAGES['flower']
+    image_contaminated = IMAGES['flower_contaminated']
+
     def __init__(self, model, contaminated=False):
         super().__init__(model)
-        self.type = 'flower'
         self.contaminated = contaminated
         self.nectar_amount = self.model.random.randint(10, 51) # measured in micrograms
         self.ppb = self.model.random.uniform(1.9, 46.4)
 
-        # Image Attributes
-        self.image = IMAGES['flower']
-        self.image_contaminated = IMAGES['flower_contaminated']
-
     def dosage(self):
         """ return dosage of pesticide in micrograms
         """
         return self.nectar_amount * self.ppb * 10**-6
 
 class Hive(Agent):
+    type = 'hive'
+    image = IMAGES['hive']
+    image_contaminated = IMAGES['hive_contaminated']
+
     def __init__(self, model, contaminated=False):
         super().__init__(model)
-        self.type = 'hive'
         self.contaminated = contaminated
         self.food_source = 0
 
-        # Image Attributes
-        self.image = IMAGES["hive"]
-        self.image_contaminated = IMAGES['hive_contaminated']
-
     def step(self):
         if self.contaminated:
             probability = 0.05
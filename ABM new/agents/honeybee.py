@@ -10,20 +10,6 @@ IMAGES = {
     'hive_contaminated': "Images/hive_contaminated.png"
 }
 
-# Use acute data only for short term effect (microgram)
-ld50_data = {
-    "honeybee": 0.0102,
-    "bumblebee": 0.014,
-    "solitary": 0.00386
-}
-
-# Controls how quickly the probability of lethality increases around the LD50 value
-steepness_dict = {
-    "honeybee": {"low": 1, "moderate": 2, "high": 4},
-    "bumblebee": {"low": 1.5, "moderate": 3, "high": 5},
-    "solitary": {"low": 1, "moderate": 2.5, "high": 4.5}
-}
-
 def hill_mortality(x, x50, n):
     """
     Hill function, return the proability of the effect
@@ -34,37 +20,40 @@ def hill_mortality(x, x50, n):
     return (x ** n) / (x ** n + x50 ** n)
 
 class HoneyBees(Agent):
+    type = 'bee'
+    image = IMAGES['bee']
+    image_contaminated = IMAGES['bee_contaminated']
+
     def __init__(self, 
                  model,
                  sensitivity, 
                  contaminated=False):
         super().__init__(model)
-        self.type = 'bee'
+        constants = self.model.parameters.agent_constants(self.model.species_id, sensitivity)
 
         # Health attributes
         self.pesticide_exposure = 0
         self.contaminated = contaminated
         self.sensitivity = sensitivity
-        self.energy = 200
-        self.energy_cost = 0.5
+        self.energy = constants['energy']
+        self.energy_cost = constants['energy_cost']
+        self.full_energy = constants['energy']
+        self.ld50 = constants['ld50']
+        self.steepness = constants['steepness']
 
         # Foraging attributes
         self.nectar = 0
-        self.max_nectar_capacity = 60
+        self.max_nectar_capacity = constants['max_nectar_capacity']
         
         # Basic Movement attributes
-        self.bee_sensing_radius = 2
-        self.speed = 5
+        self.bee_sensing_radius = constants['sensing_radius']
+        self.speed = constants['speed']
         self.max_speed = 7.5
 
         # Hive attributes
         self.hive = self.model.random.randint(1, self.model.num_hive)
         self.hive_object = None
         self.time_not_return_hive = 0
-
-        # Image attribute
-        self.image = IMAGES['bee']
-        self.image_contaminated = IMAGES['bee_contaminated']
         
     '''
     =================================
@@ -114,7 +103,7 @@ class HoneyBees(Agent):
             # Reset parameter once return to hive
             self.hive_object.food_source += self.nectar
             self.nectar = 0
-            self.energy = 200
+            self.energy = self.full_energy
 
             # Contaminate hive
             if self.contaminated:
@@ -131,9 +120,7 @@ class HoneyBees(Agent):
             self.energy -= self.energy_cost
 
     def death(self):
-        probability = hill_mortality(x=self.pesticide_exposure, 
-                                                    x50=ld50_data[self.model.bee_type],
-                                                    n=steepness_dict[self.model.bee_type][self.sensitivity])
+        probability = hill_mortality(x=self.pesticide_exposure, x50=self.ld50, n=self.steepness)
         r = self.model.random.random()
         if r < probability:
             #print('random', r)
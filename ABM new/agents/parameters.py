@@ -0,0 +1,81 @@
+import sys
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+# Registry reader shared with the delay-difference model (repository root)
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+from species_registry import REGISTRY_PATH, SPECIES, read_registry
+
+# Sensitivity id order used to index the compiled Hill steepness
+SENSITIVITIES = ('low', 'moderate', 'high')
+
+def merge_overrides(registry, overrides):
+    """
+    Recursively merge an overrides mapping into the raw registry
+    e.g. {'bumblebee': {'abm': {'energy': 500}}}
+    """
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(registry.get(key), dict):
+            merge_overrides(registry[key], value)
+        else:
+            registry[key] = value
+    return registry
+
+class SpeciesParameters:
+    """
+    Agent-based model constants compiled into flat arrays indexed by species id
+    (and sensitivity id for the Hill steepness).
+    """
+    def __init__(self, registry):
+        self.species_id = {name: index for index, name in enumerate(SPECIES)}
+        self.sensitivity_id = {name: index for index, name in enumerate(SENSITIVITIES)}
+
+        abm = [registry[name]['abm'] for name in SPECIES]
+
+        # Toxicity
+        self.ld50 = np.array([registry[name]['ld50'] for name in SPECIES], dtype=float)
+        self.steepness = np.array([[species['steepness'][level] for level in SENSITIVITIES]
+                                   for species in abm], dtype=float)
+
+        # Energy, foraging and movement
+        self.energy = np.array([species['energy'] for species in abm], dtype=float)
+        self.energy_cost = np.array([species['energy_cost'] for species in abm], dtype=float)
+        self.max_nectar_capacity = np.array([species['max_nectar_capacity'] for species in abm], dtype=float)
+        self.sensing_radius = np.array([species['sensing_radius'] for species in abm], dtype=float)
+        self.speed = np.array([species['speed'] for species in abm], dtype=float)
+        self._agent_constants = {}
+
+    def agent_constants(self, species, sensitivity):
+        """ constants of one bee as Python floats, which agents copy when they
+        are created (arithmetic on NumPy scalars is slower in the step loop)
+        """
+        key = (species, sensitivity)
+        if key not in self._agent_constants:
+            self._agent_constants[key] = {
+                'energy': float(self.energy[species]),
+                'energy_cost': float(self.energy_cost[species]),
+                'max_nectar_capacity': float(self.max_nectar_capacity[species]),
+                'sensing_radius': float(self.sensing_radius[species]),
+                'speed': float(self.speed[species]),
+                'ld50': float(self.ld50[species]),
+                'steepness': float(self.steepness[species, self.sensitivity_id[sensitivity]])
+            }
+        return self._agent_constants[key]
+
+@lru_cache(maxsize=None)
+def _default_parameters(path):
+    return SpeciesParameters(read_registry(path))
+
+def load_parameters(path=REGISTRY_PATH, overrides=None):
+    """
+    Load the species registry and compile it for the agent-based model.
+    Without overrides the compiled registry is cached, so ensembles of models
+    do not re-read the file.
+    """
+    if overrides is None:
+        return _default_parameters(Path(path))
+    return SpeciesParameters(merge_overrides(read_registry(path), overrides))
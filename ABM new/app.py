@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 import pandas as pd
 import numpy as np
 
@@ -12,7 +14,8 @@ import matplotlib.image as mpimg
 from matplotlib.offsetbox import OffsetImage, AnnotationBbox
 from PIL import Image 
 
-from pollinator_model import PollinatorModel
+from pollinator_model import PollinatorModel, bee_types
+from agents.parameters import SENSITIVITIES
 
 zoom_size ={
     'bee': 0.3,
@@ -20,8 +23,13 @@ zoom_size ={
     'hive': 1
 }
 
+@lru_cache(maxsize=None)
+def load_sprite(image):
+    # Decode each sprite once, shared by every frame and model reset
+    return np.array(Image.open(image))
+
 def add_image(ax, image, x, y, zoom=1):
-    img = np.array(Image.open(image))
+    img = load_sprite(image)
     im = OffsetImage(img, zoom=zoom)  # Adjust zoom to control image size
     ab = AnnotationBbox(im, (x, y), frameon=False, xycoords='data')
     ax.add_artist(ab)
@@ -58,8 +66,30 @@ def hive_food_plot(model):
     solara.FigureMatplotlib(fig)
     plt.close(fig)
     
+# User adjustable parameters, changing one resets the model without restarting solara
+model_params = {
+    'bee_type': {
+        'type': 'Select',
+        'value': 'bumblebee',
+        'values': list(bee_types),
+        'label': 'Bee type'
+    },
+    'sensitivity': {
+        'type': 'Select',
+        'value': 'moderate',
+        'values': list(SENSITIVITIES),
+        'label': 'Sensitivity'
+    },
+    'pesticide_ratio': Slider('Pesticide ratio', 0.7, 0, 1, 0.05),
+    'num_pollinators': Slider('Population', 100, 10, 1000, 10),
+    'width': Slider('Arena width', 500, 100, 1000, 50),
+    'height': Slider('Arena height', 500, 100, 1000, 50),
+    # Fixed seed so resets reuse the cached landscape
+    'landscape_seed': 42
+}
+
 # Initiate the model
-model = PollinatorModel(bee_type='bumblebee', sensitivity='moderate', width=500, height=500)
+model = PollinatorModel(bee_type='bumblebee', sensitivity='moderate', width=500, height=500, landscape_seed=42)
 population_plot = make_plot_component("Total Pollinators")
 # health_plot = make_plot_component("Average Bee Health")
 dosage_plot = make_plot_component('Average dosage')
@@ -76,7 +106,7 @@ page = SolaraViz(
         nectar_plot,
         hive_food_plot
         ],
-    model_params={},
+    model_params=model_params,
     name="Pollinator Model",
 )
 
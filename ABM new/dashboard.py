@@ -0,0 +1,178 @@
+import threading
+
+import numpy as np
+
+# mesa + solara imports
+import solara
+
+# matplotlib imports (Figure objects are drawn without pyplot, so they are safe off the main thread)
+from matplotlib.figure import Figure
+
+from pollinator_model import PollinatorModel
+
+FRAME_RATE = 4  # UI frames per second
+MAX_PLOT_POINTS = 500  # time series are decimated to at most this many points per frame
+
+plot_columns = ['Total Pollinators', 'Average dosage', 'Contaminated Bees', 'Average nectar']
+
+agent_style = {
+    'bee': {'marker': 'o', 's': 4},
+    'flower': {'marker': '*', 's': 30},
+    'hive': {'marker': 's', 's': 120}
+}
+
+class BackgroundRunner:
+    """
+    Advance a PollinatorModel in a background thread at full speed while the
+    dashboard samples snapshots at a fixed frame rate
+    """
+    def __init__(self, make_model):
+        self.make_model = make_model
+        self.lock = threading.Lock()
+        self.playing = threading.Event()
+        self.thread = None
+        self.model = make_model()
+
+    def play(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.playing.set()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def pause(self):
+        self.playing.clear()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def reset(self):
+        self.pause()
+        with self.lock:
+            self.model = self.make_model()
+
+    def loop(self):
+        while self.playing.is_set():
+            with self.lock:
+                if not self.model.running:
+                    break
+                self.model.step()
+        self.playing.clear()
+
+    def snapshot(self):
+        """ copy the latest agent state and decimated data collector columns
+        """
+        with self.lock:
+            model = self.model
+            agents = {agent_type: ([], []) for agent_type in agent_style}
+            hive_food = []
+            for agent in model.agents:
+                if agent.pos is None:
+                    continue
+                agents[agent.type][0].append(agent.pos)
+                agents[agent.type][1].append(agent.contaminated)
+                if agent.type == 'hive':
+                    hive_food.append(agent.food_source)
+
+            # Read the columnar store directly, only every stride-th value is copied
+            length = len(model.datacollector.model_vars[plot_columns[0]])
+            stride = max(1, length // MAX_PLOT_POINTS)
+            series = {name: np.array(model.datacollector.model_vars[name][::stride], dtype=float)
+                      for name in plot_columns}
+
+            return {
+                'step': model.steps,
+                'running': model.running,
+                'stop_reason': model.stop_reason,
+                'bee_type': model.bee_type,
+                'width': model.width,
+                'height': model.height,
+                'agents': {agent_type: (np.array(positions, dtype=float).reshape(-1, 2), np.array(flags, dtype=bool))
+                           for agent_type, (positions, flags) in agents.items()},
+                'hive_food': hive_food,
+                'steps': np.arange(0, length, stride),
+                'series': series
+            }
+
+@solara.component
+def agent_graph(snapshot):
+    fig = Figure()
+    ax = fig.subplots()
+    ax.set_xlim(0, snapshot['width'])
+    ax.set_ylim(0, snapshot['height'])
+    ax.title.set_text(f"{snapshot['bee_type']} simulation (step {snapshot['step']})")
+    ax.axis('off')
+    for agent_type, (positions, contaminated) in snapshot['agents'].items():
+        colors = np.where(contaminated, 'red', 'black' if agent_type == 'bee' else 'goldenrod')
+        ax.scatter(positions[:, 0], positions[:, 1], c=colors, **agent_style[agent_type])
+    solara.FigureMatplotlib(fig, format='png')
+
+@solara.component
+def time_series_plot(snapshot):
+    fig = Figure(figsize=(8, 6))
+    axes = fig.subplots(2, 2, sharex=True).flatten()
+    for ax, name in zip(axes, plot_columns):
+        ax.plot(snapshot['steps'], snapshot['series'][name])
+        ax.set_title(name)
+    fig.tight_layout()
+    solara.FigureMatplotlib(fig, format='png')
+
+@solara.component
+def hive_food_plot(snapshot):
+    fig = Figure()
+    ax = fig.subplots()
+    food = snapshot['hive_food']
+    ax.bar([f'hive{index}' for index in range(len(food))], food)
+    solara.FigureMatplotlib(fig, format='png')
+
+def make_model():
+    return PollinatorModel(bee_type='bumblebee', sensitivity='moderate', width=500, height=500)
+
+@solara.component
+def Page():
+    # one model runner per browser session, paused when the session closes
+    runner = solara.use_memo(lambda: BackgroundRunner(make_model), dependencies=[])
+    solara.use_effect(lambda: runner.pause, dependencies=[])
+    playing, set_playing = solara.use_state(False)
+    frame, set_frame = solara.use_state(0)
+
+    # Frame clock: re-render from the latest snapshot at a fixed rate while playing,
+    # until paused or the model stops by itself
+    def frame_clock(cancel):
+        while playing and not cancel.wait(1 / FRAME_RATE):
+            set_frame(lambda value: value + 1)
+            if not runner.playing.is_set():
+                set_playing(False)
+                break
+    solara.use_thread(frame_clock, dependencies=[playing])
+
+    def play():
+        runner.play()
+        set_playing(True)
+
+    def pause():
+        runner.pause()
+        set_playing(False)
+        set_frame(frame + 1)
+
+    def reset():
+        runner.reset()
+        set_playing(False)
+        set_frame(frame + 1)
+
+    snapshot = runner.snapshot()
+
+    with solara.Column():
+        solara.Title('Pollinator Model')
+        with solara.Row():
+            solara.Button('Play', on_click=play, disabled=playing)
+            solara.Button('Pause', on_click=pause, disabled=not playing)
+            solara.Button('Reset', on_click=reset)
+            status = f"step {snapshot['step']}"
+            if snapshot['stop_reason'] is not None:
+                status += f" (stopped: {snapshot['stop_reason']})"
+            solara.Text(status)
+        with solara.Row():
+            agent_graph(snapshot)
+            time_series_plot(snapshot)
+        hive_food_plot(snapshot)
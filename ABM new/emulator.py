@@ -0,0 +1,176 @@
+"""
+Gaussian process emulator of the PollinatorModel population curve.
+
+An ensemble of model runs over (bee_type, sensitivity, pesticide_ratio,
+num_pollinators) is fitted once (python emulator.py train ...) and saved
+with joblib; queries then take milliseconds and come with the predictive
+standard deviation. Queries outside the trained species, sensitivities or
+ranges fall back to a true model run.
+"""
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+from scipy.stats import qmc
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import RBF, ConstantKernel, WhiteKernel
+
+from pollinator_model import PollinatorModel, quiet
+from agents.parameters import SENSITIVITIES, SPECIES
+
+def population_curve(bee_type, sensitivity, pesticide_ratio, num_pollinators, steps=500, seed=None, **model_options):
+    """ 'Total Pollinators' after each of steps steps, the last value is
+    carried forward when the model stops early (e.g. on extinction)
+    """
+    model = PollinatorModel(bee_type=bee_type, sensitivity=sensitivity, pesticide_ratio=pesticide_ratio,
+                            num_pollinators=int(num_pollinators), landscape_seed=seed, seed=seed, **model_options)
+    with quiet():
+        model.run(max_steps=steps)
+    population = np.array(model.datacollector.model_vars['Total Pollinators'], dtype=float)
+    return np.pad(population, (0, steps - len(population)), mode='edge')
+
+def _run_member(member):
+    # top level so that ensemble members can run in worker processes
+    config, steps, seed, model_options = member
+    return population_curve(*config, steps=steps, seed=seed, **model_options)
+
+def design(samples, ratio_range=(0.0, 1.0), pollinator_range=(50, 250), bee_types=SPECIES,
+           sensitivities=SENSITIVITIES, seed=None):
+    """ Latin hypercube of samples (pesticide_ratio, num_pollinators) points,
+    crossed with every bee type and sensitivity
+    """
+    unit = qmc.LatinHypercube(d=2, seed=seed).random(samples)
+    points = qmc.scale(unit, (ratio_range[0], pollinator_range[0]), (ratio_range[1], pollinator_range[1]))
+    return [(bee_type, sensitivity, float(ratio), int(round(pollinators)))
+            for bee_type in bee_types for sensitivity in sensitivities for ratio, pollinators in points]
+
+def run_ensemble(configs, steps=500, replicates=1, seed=0, workers=1, **model_options):
+    """ population curves (len(configs) * replicates, steps) of every config
+    (bee_type, sensitivity, pesticide_ratio, num_pollinators), each replicate
+    with its own seed, with the configs repeated in the same order
+    """
+    members = [(config, steps, seed + index, model_options)
+               for index, config in enumerate(config for _ in range(replicates) for config in configs)]
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            curves = list(pool.map(_run_member, members, chunksize=max(1, len(members) // (4 * workers))))
+    else:
+        curves = [_run_member(member) for member in members]
+    return [config for _ in range(replicates) for config in configs], np.array(curves)
+
+class PopulationEmulator:
+    """
+    Gaussian process regression from (bee_type, sensitivity, pesticide_ratio,
+    num_pollinators) to the population at the recorded steps, with a white
+    noise term for the run-to-run variability of the model.
+    """
+    def __init__(self, steps=500, points=50, **model_options):
+        self.steps = steps
+        self.model_options = model_options
+        # recorded steps (1-based, the population after that step)
+        self.record_steps = np.unique(np.linspace(1, steps, points).round().astype(int))
+        self.bee_types = ()
+        self.sensitivities = ()
+        self.ranges = None
+        self.gp = None
+
+    def features(self, configs):
+        # one-hot bee type, sensitivity level and the two numeric inputs
+        rows = []
+        for bee_type, sensitivity, pesticide_ratio, num_pollinators in configs:
+            one_hot = [float(bee_type == name) for name in SPECIES]
+            rows.append(one_hot + [SENSITIVITIES.index(sensitivity), pesticide_ratio, num_pollinators])
+        return np.array(rows, dtype=float)
+
+    def fit(self, configs, curves):
+        """ fit to population curves (len(configs), steps) from run_ensemble
+        """
+        X = self.features(configs)
+        self.bee_types = tuple(sorted({config[0] for config in configs}))
+        self.sensitivities = tuple(sorted({config[1] for config in configs}))
+        self.ranges = (X[:, -2:].min(axis=0), X[:, -2:].max(axis=0))
+        scale = np.maximum(X.std(axis=0), 1e-3)
+        kernel = (ConstantKernel() * RBF(length_scale=scale, length_scale_bounds=(1e-3, 1e5))
+                  + WhiteKernel(noise_level=1e-2, noise_level_bounds=(1e-6, 1e1)))
+        self.gp = GaussianProcessRegressor(kernel=kernel, normalize_y=True, n_restarts_optimizer=2, random_state=0)
+        self.gp.fit(X, np.asarray(curves)[:, self.record_steps - 1])
+        return self
+
+    def in_range(self, config):
+        bee_type, sensitivity, pesticide_ratio, num_pollinators = config
+        low, high = self.ranges
+        return (bee_type in self.bee_types and sensitivity in self.sensitivities
+                and low[0] <= pesticide_ratio <= high[0] and low[1] <= num_pollinators <= high[1])
+
+    def predict(self, configs):
+        """ mean and standard deviation (len(configs), len(record_steps)) of
+        the population at record_steps, populations are non-negative
+        """
+        mean, std = self.gp.predict(self.features(configs), return_std=True)
+        mean = np.reshape(mean, (len(configs), -1))
+        std = np.reshape(std, (len(configs), -1))
+        return np.maximum(mean, 0), std
+
+    def query(self, bee_type, sensitivity, pesticide_ratio, num_pollinators, fallback=True, seed=None):
+        """
+        Population curve of one configuration as a dict with the recorded
+        'steps', 'mean', 'std' and its 'source': 'emulator', or 'model' for a
+        true run when the configuration is outside the trained range (std is
+        then zero). Without fallback an out of range query raises ValueError.
+        """
+        config = (bee_type, sensitivity, pesticide_ratio, num_pollinators)
+        if self.in_range(config):
+            mean, std = self.predict([config])
+            return {'steps': self.record_steps, 'mean': mean[0], 'std': std[0], 'source': 'emulator'}
+        if not fallback:
+            raise ValueError(f'{config} is outside the trained range of the emulator')
+        curve = population_curve(*config, steps=self.steps, seed=seed, **self.model_options)[self.record_steps - 1]
+        return {'steps': self.record_steps, 'mean': curve, 'std': np.zeros_like(curve), 'source': 'model'}
+
+    def save(self, path):
+        # attributes only, so files written from the command line load anywhere
+        joblib.dump(vars(self), path)
+
+    @classmethod
+    def load(cls, path):
+        emulator = cls.__new__(cls)
+        emulator.__dict__.update(joblib.load(path))
+        return emulator
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train or query the PollinatorModel population emulator')
+    commands = parser.add_subparsers(dest='command', required=True)
+    train = commands.add_parser('train', help='run an ensemble and fit the emulator')
+    train.add_argument('output', help='emulator file (.joblib)')
+    train.add_argument('--samples', type=int, default=12, help='(pesticide_ratio, num_pollinators) points per bee type and sensitivity')
+    train.add_argument('--replicates', type=int, default=2)
+    train.add_argument('--steps', type=int, default=500)
+    train.add_argument('--points', type=int, default=50, help='recorded steps per population curve')
+    train.add_argument('--bee-types', nargs='+', default=list(SPECIES), choices=SPECIES)
+    train.add_argument('--workers', type=int, default=1)
+    train.add_argument('--seed', type=int, default=0)
+    query = commands.add_parser('query', help='predict a population curve')
+    query.add_argument('emulator', help='emulator file (.joblib)')
+    query.add_argument('bee_type', choices=SPECIES)
+    query.add_argument('sensitivity', choices=SENSITIVITIES)
+    query.add_argument('pesticide_ratio', type=float)
+    query.add_argument('num_pollinators', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        configs = design(args.samples, bee_types=args.bee_types, seed=args.seed)
+        start = time.perf_counter()
+        configs, curves = run_ensemble(configs, args.steps, args.replicates, args.seed, args.workers)
+        print(f'{len(curves)} runs in {time.perf_counter() - start:.1f} s')
+        emulator = PopulationEmulator(args.steps, args.points).fit(configs, curves)
+        print(f'kernel: {emulator.gp.kernel_}')
+        emulator.save(args.output)
+    else:
+        emulator = PopulationEmulator.load(args.emulator)
+        start = time.perf_counter()
+        result = emulator.query(args.bee_type, args.sensitivity, args.pesticide_ratio, args.num_pollinators)
+        print(f"{result['source']} answer in {1000 * (time.perf_counter() - start):.1f} ms")
+        for step, mean, std in zip(result['steps'], result['mean'], result['std']):
+            print(f'step {step}: {mean:.1f} +- {std:.1f}')
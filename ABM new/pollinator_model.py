@@ -1,3 +1,8 @@
+import io
+import time
+from contextlib import redirect_stdout
+from functools import lru_cache
+
 import numpy as np
 from mesa import Model
 from mesa.space import ContinuousSpace
@@ -7,6 +12,7 @@ from agents.honeybee import HoneyBees
 from agents.bumblebee import BumbleBees
 from agents.solitarybee import SolitaryBees
 from agents.hive_flower import Hive, Flower
+from agents.parameters import load_parameters
 
 bee_types = {
     'honeybee' : HoneyBees,
@@ -14,6 +20,22 @@ bee_types = {
     'solitary' : SolitaryBees
 }
 
+@lru_cache(maxsize=32)
+def generate_landscape(width, height, num_flowers, seed):
+    """ flower positions and contamination draws, cached so that model resets
+    (e.g. from the Solara controls) reuse the same landscape
+    """
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform((0, 0), (width, height), size=(num_flowers, 2))
+    contamination_draws = rng.random(num_flowers)
+    return positions, contamination_draws
+
+def quiet():
+    """ context manager silencing the agents' progress output while a model
+    runs (Hive.step reports every new bee)
+    """
+    return redirect_stdout(io.StringIO())
+
 class PollinatorModel(Model):
     def __init__(self, 
                  bee_type='honeybee',
@@ -23,14 +45,34 @@ class PollinatorModel(Model):
                  num_pollinators=100, 
                  avg_flowers_per_unit=0.01, 
                  num_hive=2,
-                 pesticide_ratio=0.7,):
-        super().__init__()
+                 pesticide_ratio=0.7,
+                 landscape_seed=None,
+                 parameters=None,
+                 stop_on_extinction=False,
+                 plateau_window=None,
+                 plateau_tolerance=0.01,
+                 max_wall_time=None,
+                 seed=None):
+        super().__init__(seed=seed)
 
         self.width = width
         self.height = height
         self.num_hive = num_hive
         self.sensitivity = sensitivity
 
+        # Species constants from the shared registry (override for parameter sweeps)
+        self.parameters = load_parameters() if parameters is None else parameters
+        self.species_id = self.parameters.species_id[bee_type]
+
+        # Early stopping conditions (reason is recorded in stop_reason)
+        self.stop_on_extinction = stop_on_extinction
+        self.plateau_window = plateau_window  # steps
+        self.plateau_tolerance = plateau_tolerance  # relative to mean population
+        self.max_wall_time = max_wall_time  # seconds
+        self.stop_reason = None
+        self.stop_step = None
+        self.start_time = None  # set by run()
+
         # Create Continuous space
         self.space = ContinuousSpace(width, height, True)
         
@@ -50,11 +92,18 @@ class PollinatorModel(Model):
                                                 sensitivity=sensitivity)
 
         # place flower agent
-        for i in flower_agents:
-            x, y = self.random.uniform(0, width), self.random.uniform(0, height)
-            contaminated = self.random.random() < pesticide_ratio
-            i.contaminated = contaminated
-            self.space.place_agent(i, (x, y))
+        if landscape_seed is None:
+            for i in flower_agents:
+                x, y = self.random.uniform(0, width), self.random.uniform(0, height)
+                contaminated = self.random.random() < pesticide_ratio
+                i.contaminated = contaminated
+                self.space.place_agent(i, (x, y))
+        else:
+            # Reuse the cached landscape, only the pesticide ratio threshold changes
+            positions, contamination_draws = generate_landscape(width, height, num_flowers, landscape_seed)
+            for i, (x, y), draw in zip(flower_agents, positions, contamination_draws):
+                i.contaminated = draw < pesticide_ratio
+                self.space.place_agent(i, (x, y))
 
         # Add flower memory to bumblebee
         if self.bee_type == 'bumblebee':
@@ -89,6 +138,46 @@ class PollinatorModel(Model):
 
         # Collect model data
         self.datacollector.collect(self)
+
+        self.check_stopping()
+
+    def check_stopping(self):
+        """ stop the run on extinction, population plateau or wall time limit,
+        recording the first reason and the step it occurred at
+        """
+        if self.stop_reason is not None:
+            return
+        population = self.datacollector.model_vars['Total Pollinators']
+        reason = None
+        if self.stop_on_extinction and population[-1] == 0:
+            reason = 'extinction'
+        elif self.plateau_window is not None and len(population) >= self.plateau_window:
+            window = population[-self.plateau_window:]
+            if max(window) - min(window) <= self.plateau_tolerance * max(np.mean(window), 1):
+                reason = 'plateau'
+        if (reason is None and self.max_wall_time is not None and self.start_time is not None
+                and time.perf_counter() - self.start_time > self.max_wall_time):
+            reason = 'wall time'
+
+        if reason is not None:
+            self.stop_reason = reason
+            self.stop_step = self.steps
+            self.running = False
+
+    def run(self, max_steps=1000):
+        """ step until a stopping condition is met or max_steps is reached,
+        the wall time budget counts from this call
+        """
+        self.start_time = time.perf_counter()
+        if self.stop_reason == 'max steps':
+            # resumed after reaching an earlier max_steps
+            self.stop_reason = self.stop_step = None
+        while self.running and self.steps < max_steps:
+            self.step()
+        if self.stop_reason is None:
+            self.stop_reason = 'max steps'
+            self.stop_step = self.steps
+        return self.stop_reason
     
     def add_agent(self, hive):
         # Initiate bee type
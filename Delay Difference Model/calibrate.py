@@ -0,0 +1,130 @@
+"""
+Calibration of delay-difference parameters against observed population series.
+
+Selected parameters are estimated by differential evolution, minimising the
+scaled squared error between the simulated and observed trajectories. Each
+generation of the optimiser is evaluated as one batch of scenarios
+(engine.simulate_batch), optionally split over worker processes.
+
+Observations are a CSV file with a 'day' column (model days) and one column
+per observed quantity ('N', 'E', 'L', 'P', 'H', 'F' or 'S'); empty cells are
+ignored, e.g.
+
+	day,N,F
+	10,5200,800
+	20,12100,
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+
+import numpy as np
+from scipy.optimize import differential_evolution
+
+from engine import STAGES, STRUCTURAL_KEYS, simulate, simulate_batch
+from parameters import load_species
+
+OBSERVABLE_KEYS = STAGES + ('N', 'S')
+
+
+def read_observations(path):
+	"""
+	Return {'day': (n,) int array, key: (n,) float array, ...} with nan for
+	missing values
+	"""
+	data = np.genfromtxt(path, delimiter=',', names=True, dtype=float)
+	names = data.dtype.names
+	if 'day' not in names:
+		raise ValueError(f"observation file {path} has no 'day' column")
+	unknown = set(names) - {'day'} - set(OBSERVABLE_KEYS)
+	if unknown:
+		raise ValueError(f'unknown observed quantities {sorted(unknown)}, expected some of {OBSERVABLE_KEYS}')
+	observations = {name: np.atleast_1d(data[name]) for name in names}
+	observations['day'] = observations['day'].astype(int)
+	return observations
+
+
+def batch_loss(params, observations, names, pesticide, x):
+	"""
+	Scaled squared error of every candidate in x (shape (len(names), B)):
+	for each observed quantity the mean of ((model - observed) / scale) ** 2
+	over the observed days, scale being the mean observed magnitude,
+	summed over quantities
+	"""
+	keys = tuple(key for key in observations if key != 'day')
+	result = simulate_batch(dict(params, **dict(zip(names, x))), pesticide, record=keys)
+	index = observations['day'] - params['start_day']
+	loss = np.zeros(x.shape[1])
+	for key in keys:
+		observed = observations[key]
+		valid = ~np.isnan(observed)
+		scale = np.mean(np.abs(observed[valid])) or 1.0
+		error = (result[key][:, index[valid]] - observed[valid]) / scale
+		loss += np.mean(error ** 2, axis=1)
+	# diverging or invalid scenarios lose
+	return np.where(np.isfinite(loss), loss, np.inf)
+
+
+def calibrate(params, observations, bounds, pesticide=False, workers=1, seed=None, **options):
+	"""
+	Estimate the parameters in bounds ({name: (low, high)}) of params from
+	observations (see read_observations) by differential evolution.
+	With workers > 1 each generation is split over that many processes.
+	Further options are passed to scipy.optimize.differential_evolution
+	(e.g. popsize, maxiter, tol).
+
+	Returns a dict with the fitted 'values', the full fitted 'params', the
+	final 'loss' and the scipy 'result'.
+	"""
+	names = tuple(bounds)
+	for name in names:
+		if name in STRUCTURAL_KEYS or name not in params:
+			raise KeyError(f'cannot calibrate {name}: not a numeric delay-difference parameter')
+	days = observations['day'] - params['start_day']
+	if days.min() < 0 or days.max() >= params['T'] - params['start_day']:
+		raise ValueError(f"observed days must lie in [{params['start_day']}, {params['T']})")
+
+	loss = partial(batch_loss, params, observations, names, pesticide)
+	with ProcessPoolExecutor(workers) if workers > 1 else nullcontext() as pool:
+		def objective(x):
+			if pool is None:
+				return loss(x)
+			chunks = [chunk for chunk in np.array_split(x, workers, axis=1) if chunk.shape[1]]
+			return np.concatenate(list(pool.map(loss, chunks)))
+
+		result = differential_evolution(objective, [bounds[name] for name in names], vectorized=True,
+										updating='deferred', seed=seed, **options)
+
+	values = dict(zip(names, result.x.tolist()))
+	return {'values': values, 'params': dict(params, **values), 'loss': result.fun, 'result': result}
+
+
+def parse_bounds(items):
+	# 'name=low:high' strings to {name: (low, high)}
+	bounds = {}
+	for item in items:
+		name, _, limits = item.partition('=')
+		low, high = (float(value) for value in limits.split(':'))
+		bounds[name] = (low, high)
+	return bounds
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Fit delay-difference parameters to an observed population series')
+	parser.add_argument('species', choices=('honeybee', 'bumblebee', 'solitary'))
+	parser.add_argument('observations', help='CSV file with a day column and observed N / stage columns')
+	parser.add_argument('bounds', nargs='+', help='parameters to fit as name=low:high, e.g. s_F=0.9:0.99')
+	parser.add_argument('--pesticide', action='store_true')
+	parser.add_argument('--workers', type=int, default=1)
+	parser.add_argument('--maxiter', type=int, default=200)
+	parser.add_argument('--popsize', type=int, default=30)
+	parser.add_argument('--seed', type=int, default=None)
+	args = parser.parse_args()
+
+	params = load_species(args.species)
+	fit = calibrate(params, read_observations(args.observations), parse_bounds(args.bounds), args.pesticide,
+					args.workers, args.seed, maxiter=args.maxiter, popsize=args.popsize)
+	for name, value in fit['values'].items():
+		print(f'{name}: {value:.6g} (registry {params[name]:.6g})')
+	print(f"loss: {fit['loss']:.3e}, final N: {simulate(fit['params'], args.pesticide)['final']['N']:.2f}")
@@ -0,0 +1,205 @@
+"""
+Hybrid coupling of the agent-based model (ABM new) to the delay-difference
+engine.
+
+A short ABM burst gives every bee's pesticide intake and the nectar it
+collected. Their ratio is the concentration of pesticide in collected food
+that the delay-difference engine takes as its daily exposure (µg/g): the
+pooled ratio for the colony and its distribution over bees, whose quantiles
+become a batch of exposure scenarios.
+
+Coupling periods are dicts like the applications of exposure.py, with the
+model 'day' they start, their 'duration' in days and the 'pesticide_ratio'
+of contaminated flowers, e.g. repeated every year with
+exposure.repeat_yearly. Burst summaries are cached by their ABM parameters
+(in memory and optionally as .npz files), so periods that share the same
+parameters run the ABM once. The keys include the agent constants of the
+species and a hash of the ABM source, so cached bursts are not reused after
+registry or model edits.
+"""
+import hashlib
+import sys
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from engine import RECORD_KEYS, simulate_batch
+from exposure import repeat_yearly
+from seasonal import YEAR, season_profiles
+
+# The agent-based model imports its agents relative to its own folder
+ABM_PATH = Path(__file__).resolve().parents[1] / 'ABM new'
+
+# Flower.dosage is nectar_amount * ppb * 1e-6, so pesticide per nectar * 1e6
+# is the nectar concentration in ppb, and 1 ppb = 1e-3 µg/g
+CONCENTRATION_PER_RATIO = 1e6 * 1e-3
+
+# version of the burst summaries in cache_dir, bumped when their format changes
+CACHE_VERSION = 2
+
+# model options that can be part of a cache key
+KEY_TYPES = (type(None), bool, int, float, str)
+
+# summaries of the bursts run so far, by abm_key
+_SUMMARIES = {}
+
+
+def import_abm():
+	# make PollinatorModel importable
+	if str(ABM_PATH) not in sys.path:
+		sys.path.append(str(ABM_PATH))
+
+
+@lru_cache(maxsize=None)
+def abm_source_hash():
+	# sha1 of the source of PollinatorModel and its agents
+	digest = hashlib.sha1()
+	for path in [ABM_PATH / 'pollinator_model.py', *sorted((ABM_PATH / 'agents').glob('*.py'))]:
+		digest.update(path.read_bytes())
+	return digest.hexdigest()
+
+
+def abm_key(bee_type, sensitivity, pesticide_ratio, num_pollinators=100, steps=200, seed=0, parameters=None,
+			**model_options):
+	"""
+	Hashable key of the ABM parameters of a burst: the cache version, the ABM
+	source hash, the agent constants of bee_type and sensitivity (from
+	parameters, by default the species registry) and the other options,
+	which must be None, bool, int, float or str
+	"""
+	for name, value in dict(seed=seed, **model_options).items():
+		if not isinstance(value, KEY_TYPES):
+			raise TypeError(f'{name}={value!r} cannot be part of a cache key, expected None, bool, int, float or str')
+	import_abm()
+	from agents.parameters import load_parameters
+
+	parameters = load_parameters() if parameters is None else parameters
+	constants = parameters.agent_constants(parameters.species_id[bee_type], sensitivity)
+	return (CACHE_VERSION, abm_source_hash(), bee_type, sensitivity, float(pesticide_ratio), int(num_pollinators),
+			int(steps), seed, tuple(sorted(constants.items())), tuple(sorted(model_options.items())))
+
+
+def run_burst(bee_type, sensitivity, pesticide_ratio, num_pollinators=100, steps=200, seed=0, **model_options):
+	"""
+	Run PollinatorModel for steps steps (same landscape for every
+	pesticide_ratio with the same seed) and track the pesticide and nectar
+	each bee collects while foraging.
+
+	Returns a dict with per-bee 'intake' (pesticide) and 'nectar' arrays,
+	the pooled collected 'concentration' (µg/g), the sorted per-bee
+	'bee_concentration' (µg/g, bees that collected nectar), the mean
+	'dose_rate' per bee and step (Flower.dosage units), the 'contaminated'
+	fraction of live bees and the 'population' after every step.
+	"""
+	import_abm()
+	from pollinator_model import PollinatorModel, bee_types, quiet
+
+	model = PollinatorModel(bee_type=bee_type, sensitivity=sensitivity, num_pollinators=num_pollinators,
+							pesticide_ratio=pesticide_ratio, landscape_seed=seed, seed=seed, **model_options)
+	Bees = bee_types[bee_type]
+	# unique_id: [last exposure, last nectar, intake, collected nectar, steps alive]
+	tracked = {}
+	population = []
+	with quiet():
+		while model.running and model.steps < steps:
+			model.step()
+			for bee in model.agents_by_type[Bees]:
+				record = tracked.setdefault(bee.unique_id, [0.0, 0.0, 0.0, 0.0, 0])
+				record[2] += bee.pesticide_exposure - record[0]
+				# nectar drops to zero when delivered, otherwise it grows by what was foraged
+				if bee.nectar >= record[1]:
+					record[3] += bee.nectar - record[1]
+				record[0], record[1] = bee.pesticide_exposure, bee.nectar
+				record[4] += 1
+			population.append(len(model.agents_by_type[Bees]))
+
+	records = np.array(list(tracked.values())).reshape(-1, 5)
+	intake, nectar = records[:, 2], records[:, 3]
+	foraging = nectar > 0
+	live = model.agents_by_type[Bees]
+	return {
+		'intake': intake,
+		'nectar': nectar,
+		'concentration': intake.sum() / nectar.sum() * CONCENTRATION_PER_RATIO if nectar.sum() else 0.0,
+		'bee_concentration': np.sort(intake[foraging] / nectar[foraging] * CONCENTRATION_PER_RATIO),
+		'dose_rate': intake.sum() / max(records[:, 4].sum(), 1),
+		'contaminated': np.mean([bee.contaminated for bee in live]) if len(live) else 0.0,
+		'population': np.array(population)
+	}
+
+
+def abm_summary(bee_type, sensitivity, pesticide_ratio, num_pollinators=100, steps=200, seed=0,
+				cache_dir=None, **model_options):
+	"""
+	run_burst summary, computed once per set of ABM parameters: looked up in
+	memory, then in cache_dir (one .npz file per key) and only then run
+	"""
+	key = abm_key(bee_type, sensitivity, pesticide_ratio, num_pollinators, steps, seed, **model_options)
+	if key in _SUMMARIES:
+		return _SUMMARIES[key]
+	path = None
+	if cache_dir is not None:
+		path = Path(cache_dir) / f'abm_{hashlib.sha1(repr(key).encode()).hexdigest()[:16]}.npz'
+		if path.exists():
+			with np.load(path) as data:
+				_SUMMARIES[key] = {name: data[name] if data[name].ndim else data[name].item() for name in data.files}
+			return _SUMMARIES[key]
+
+	summary = run_burst(bee_type, sensitivity, pesticide_ratio, num_pollinators, steps, seed, **model_options)
+	if path is not None:
+		path.parent.mkdir(parents=True, exist_ok=True)
+		np.savez(path, **summary)
+	_SUMMARIES[key] = summary
+	return summary
+
+
+def coupled_exposure(params, periods, bee_type, sensitivity, quantiles=None, days=None, **abm_options):
+	"""
+	Daily concentration in collected food (µg/g) for engine.simulate_batch:
+	the burst concentration of each period on its days and zero elsewhere.
+	Without quantiles the pooled concentration gives a (days,) array, with
+	quantiles the per-bee concentration quantiles give one
+	(len(quantiles), days) row each.
+	Further abm_options (num_pollinators, steps, seed, cache_dir, ...) are
+	passed to abm_summary.
+	"""
+	if days is None:
+		days = params['T'] - params['start_day']
+	exposure = np.zeros((1 if quantiles is None else len(quantiles), days))
+	for period in periods:
+		summary = abm_summary(bee_type, sensitivity, period['pesticide_ratio'], **abm_options)
+		if quantiles is None:
+			level = summary['concentration']
+		elif len(summary['bee_concentration']):
+			level = np.quantile(summary['bee_concentration'], quantiles)
+		else:
+			level = np.zeros(len(quantiles))
+		start = max(period['day'] - params['start_day'], 0)
+		stop = min(period['day'] - params['start_day'] + period['duration'], days)
+		if start < stop:
+			exposure[:, start:stop] = np.reshape(level, (-1, 1))
+	return exposure[0] if quantiles is None else exposure
+
+
+def simulate_coupled(params, periods, bee_type, sensitivity, quantiles=None, years=None, record=RECORD_KEYS,
+					 record_every=1, laying=(60, 300), foraging=(75, 290), winter_survival=0.995, **abm_options):
+	"""
+	Run the delay-difference model with pesticide under the ABM-derived
+	exposure of coupled_exposure (one scenario per quantile). With years the
+	run spans that many seasonal years (see seasonal.simulate_years) and the
+	periods repeat every year, reusing the cached bursts.
+
+	Returns the engine.simulate_batch dict plus the 'exposure' used.
+	"""
+	if years is not None:
+		params = dict(params, T=params['start_day'] + years * YEAR)
+		periods = repeat_yearly(periods, years, YEAR)
+	exposure = coupled_exposure(params, periods, bee_type, sensitivity, quantiles, **abm_options)
+	season = None
+	if years is not None:
+		season = season_profiles(params['start_day'], params['T'] - params['start_day'], laying, foraging,
+								 winter_survival)
+	result = simulate_batch(params, True, record, exposure, season, record_every)
+	result['exposure'] = exposure
+	return result
@@ -0,0 +1,480 @@
+"""
+Stage-structured delay-difference model (egg, larvae, pupae, hive, forager)
+shared by the honeybee, bumble bee and solitary bee scripts.
+
+The engine only depends on numpy, so it can be imported and called many
+times from parameter sweeps without importing matplotlib.
+"""
+from functools import partial
+
+import numpy as np
+
+from exposure import concentration_schedule
+from kernel import JIT_AVAILABLE, new_eggs, simulate_compiled
+
+STAGES = ('E', 'L', 'P', 'H', 'F')
+
+
+def recruitment(params, N, total_F, daily_egg=None):
+	# new eggs per day (see kernel.new_eggs), daily_egg overrides params['daily_egg']
+	daily_egg = params['daily_egg'] if daily_egg is None else daily_egg
+	return new_eggs(daily_egg, params['K'], params['female_ratio'], params['recruitment'] == 'per_forager', N, total_F)
+
+
+def simulate(params, pesticide=False, backend='auto', exposure=None):
+	"""
+	Run the delay-difference model for one species parameter set
+	(see parameters.load_species) and return the daily trajectories as arrays.
+	backend is 'numpy' (simulate_batch with one scenario), 'jit' (compiled
+	kernel, needs numba) or 'auto' (the compiled kernel when numba is installed
+	and params has no 'viable_adults', which only the NumPy version applies,
+	see advance). exposure is the daily
+	concentration of pesticide in collected food (see
+	exposure.concentration_schedule), by default the decaying pesticide_conc.
+
+	Returns a dict with 'days', the stage totals 'E', 'L', 'P', 'H', 'F',
+	the total population 'N' and food store 'S'. With pesticide it also holds
+	the pesticide in food 'Pest' (µg), its concentration 'Cp' (µg/g) and the
+	final cumulative doses per cohort 'cum_L', 'cum_H', 'cum_F' (µg/bee).
+	"""
+	days = np.arange(params['start_day'], params['T'])
+	exposure = concentration_schedule(params) if exposure is None else np.asarray(exposure, dtype=float)
+	if exposure.shape != days.shape:
+		raise ValueError(f'exposure must have one value per day, expected shape {days.shape}, got {exposure.shape}')
+
+	if backend == 'jit' and 'viable_adults' in params:
+		raise ValueError("the compiled kernel does not apply viable_adults, use backend='numpy'")
+	if backend == 'jit' or (backend == 'auto' and JIT_AVAILABLE and 'viable_adults' not in params):
+		return simulate_compiled(params, pesticide, exposure)
+	if backend not in ('auto', 'numpy'):
+		raise ValueError(f"unknown backend: {backend}, expected 'auto', 'numpy' or 'jit'")
+
+	# the NumPy version is a batch of one scenario with the batch axis dropped
+	batch = simulate_batch(params, pesticide, exposure=exposure)
+	result = {key: value if key == 'days' else value[0] for key, value in batch.items() if key != 'final'}
+	result['final'] = {key: value[0] for key, value in batch['final'].items()}
+	return result
+
+
+# trajectories recorded by default
+RECORD_KEYS = ('E', 'L', 'P', 'H', 'F', 'N', 'S', 'Pest', 'Cp')
+
+# parameters that fix array shapes and so cannot vary across a batch
+STRUCTURAL_KEYS = ('T', 'start_day', 'dur_E', 'dur_L', 'dur_P', 'dur_H', 'dur_F', 'recruitment')
+
+
+def batch_parameters(params, batch=1):
+	"""
+	Broadcast every numeric (non-structural) parameter to a (B,) array of
+	scenarios, where B is the common length of the array-valued parameters
+	and batch
+	"""
+	numeric = {key: np.asarray(value, dtype=float) for key, value in params.items()
+			   if key not in STRUCTURAL_KEYS}
+	shape = np.broadcast_shapes((batch,), *(value.shape for value in numeric.values()))
+	if len(shape) > 1:
+		raise ValueError(f'scenario parameters must be scalars or 1-d arrays, got shape {shape}')
+	batch = shape[0] if shape else 1
+	batched = {key: np.broadcast_to(value, (batch,)) for key, value in numeric.items()}
+	batched.update({key: params[key] for key in STRUCTURAL_KEYS})
+	return batched, batch
+
+
+def scenario_grid(params, **values):
+	"""
+	Full factorial grid of scenarios, e.g.
+	scenario_grid(params, K=np.linspace(30000, 90000, 100), hill_n=[1, 2, 3])
+	returns a copy of params with each swept parameter as a flat (B,) array
+	"""
+	grids = np.meshgrid(*(np.asarray(value, dtype=float) for value in values.values()), indexing='ij')
+	swept = dict(params)
+	swept.update({key: grid.ravel() for key, grid in zip(values, grids)})
+	return swept
+
+
+def initial_state(params, batch):
+	"""
+	Stage queues as fixed-size ring buffers of shape (B, duration): the oldest
+	cohort of a stage with duration d sits in column k % d on step k, where it
+	is replaced by the cohort entering the stage
+	"""
+	state = {}
+	for stage in STAGES:
+		state[stage] = np.repeat(params['initial_stage'][:, None], params[f'dur_{stage}'], axis=1).astype(float)
+		state[f'total_{stage}'] = state[stage].sum(axis=1)
+	# cumulative pesticide dose of each cohort (eggs and pupae carry no dose)
+	for stage in ('L', 'H', 'F'):
+		state[f'cum_{stage}'] = np.zeros_like(state[stage])
+	state['S'] = params['S0'].copy()
+	state['Pest'] = params['pesticide'].copy()  # measured as µg
+	state['Cp'] = np.zeros(batch)
+	# overwintering adults and their mean dose (see seasonal.season_profiles)
+	state['W'] = np.zeros(batch)
+	state['cum_W'] = np.zeros(batch)
+	# colonies that reached and then lost viable_adults adults (see advance)
+	state['established'] = np.zeros(batch, dtype=bool)
+	state['collapsed'] = np.zeros(batch, dtype=bool)
+	# food limitation of survival on the last step (see advance)
+	state['eta'] = np.ones(batch)
+	return state
+
+
+def multiply_survivors(queue, probability):
+	queue *= probability
+
+
+def draw_survivors(rng, queue, probability):
+	# each individual of a cohort survives independently
+	queue[...] = rng.binomial(queue.astype(np.int64), probability)
+
+
+def advance(state, params, k, pesticide=False, exposure=None, season=None, rng=None):
+	"""
+	Advance every scenario in state by one day (step k) in place and return
+	the total population N at the start of the day. With pesticide, exposure
+	is the (B, days) concentration of pesticide in collected food. season
+	optionally holds (1, days) or (B, days) multipliers 'laying' of daily_egg
+	and 'foraging' of food_collect_per_F (see seasonal.season_profiles), and
+	for overwintering the 0/1 'winter' day flags and the daily
+	'winter_survival' of the winter cohort W: during winter, foragers at the
+	end of their forager life join W instead of leaving. W survives at
+	winter_survival over winter and at s_F once foraging restarts, and feeds,
+	forages and lays (per-forager recruitment) like foragers, so it bridges
+	the spring until the new brood emerges.
+	With a numpy Generator rng the update is stochastic: binomial survival per
+	cohort and Poisson recruitment (see stochastic.simulate_replicates). With
+	a 'viable_adults' parameter a colony whose adults (H, F and W) fall below
+	it after having reached it has collapsed and recruits no more eggs.
+	"""
+	E, L, P, H, F = (state[stage] for stage in STAGES)
+	total_E, total_L, total_P, total_H, total_F = (state[f'total_{stage}'] for stage in STAGES)
+
+	W = state['W']
+	N = total_E + total_L + total_P + total_H + total_F + W  # total population
+	foragers = total_F + W
+
+	daily_egg, food_collect_per_F = params['daily_egg'], params['food_collect_per_F']
+	if season is not None:
+		daily_egg = daily_egg * season['laying'][:, k]
+		food_collect_per_F = food_collect_per_F * season['foraging'][:, k]
+
+	E_new = recruitment(params, N, foragers, daily_egg)
+	if 'viable_adults' in params:
+		adults = total_H + foragers
+		state['established'] |= adults >= params['viable_adults']
+		state['collapsed'] |= state['established'] & (adults < params['viable_adults'])
+		E_new = np.where(state['collapsed'], 0.0, E_new)
+	if rng is not None:
+		E_new = rng.poisson(E_new).astype(float)
+
+	# food comsumption
+	S = state['S']
+	D = params['c_L'] * total_L + params['c_H'] * total_H + params['c_F'] * foragers
+	eta = np.clip(np.divide(S, D, out=np.ones_like(D), where=D != 0), 0, 1)
+	state['eta'] = eta
+
+	# food remain
+	S = np.maximum(S, 0) + food_collect_per_F * foragers - D
+	state['S'] = S
+
+	if pesticide:
+		# update pesticide changes
+		d_factor = (0.5) ** (1 / params['half_life'])
+		pest = state['Pest'] * d_factor
+		delta_P_new = exposure[:, k] * food_collect_per_F * foragers
+		delta_P_consumed = np.divide(pest * D, S, out=np.zeros_like(S), where=S > 0)
+		pest = pest - delta_P_consumed + delta_P_new
+		state['Pest'] = pest
+		state['Cp'] = np.divide(pest, S, out=np.zeros_like(S), where=S > 0)  # pesticide concentration
+
+	# survival as one vector multiply per stage, or binomial draws per cohort
+	survive = multiply_survivors if rng is None else partial(draw_survivors, rng)
+	# Egg and pupae (without food intake)
+	survive(E, params['s_E'][:, None])
+	total_E = total_E * params['s_E']
+	survive(P, params['s_P'][:, None])
+	total_P = total_P * params['s_P']
+
+	# Larvae, hive and forager
+	if pesticide:
+		# pesticide daily intake and survival after Hill mortality,
+		# 1 / (1 + (q / LD50) ** n)
+		Cp = state['Cp']
+		ld50 = params['LD50'][:, None]
+		# a shared Hill coefficient uses numpy's fast scalar power (e.g. squaring for n = 2)
+		hill_n = params['hill_n'][0] if np.all(params['hill_n'] == params['hill_n'][0]) else params['hill_n'][:, None]
+		for stage, queue in (('L', L), ('H', H), ('F', F)):
+			cum = state[f'cum_{stage}']
+			cum += (params[f'c_{stage}'] * Cp)[:, None]
+			work = np.divide(cum, ld50)
+			np.power(work, hill_n, out=work)
+			work += 1
+			np.divide((params[f's_{stage}'] * eta)[:, None], work, out=work)
+			survive(queue, work)
+		total_L, total_H, total_F = L.sum(axis=1), H.sum(axis=1), F.sum(axis=1)
+	else:
+		survive(L, (params['s_L'] * eta)[:, None])
+		total_L = total_L * params['s_L'] * eta
+		survive(H, (params['s_H'] * eta)[:, None])
+		total_H = total_H * params['s_H'] * eta
+		survive(F, (params['s_F'] * eta)[:, None])
+		total_F = total_F * params['s_F'] * eta
+	wintering = season is not None and 'winter' in season
+	if wintering:
+		# winter_survival only over winter, forager survival once foraging restarts
+		winter_survival = np.where(season['winter'][:, k] > 0, season['winter_survival'], params['s_F']) * eta
+		if pesticide:
+			state['cum_W'] += params['c_F'] * Cp
+			winter_survival = winter_survival / (1 + (state['cum_W'] / params['LD50']) ** params['hill_n'])
+		survive(W[:, None], winter_survival[:, None])
+	if rng is not None:
+		total_E, total_L, total_P, total_H, total_F = (queue.sum(axis=1) for queue in (E, L, P, H, F))
+
+	# transfer to next stage by overwriting the oldest cohort at each head
+	head_E, head_L, head_P, head_H, head_F = (k % queue.shape[1] for queue in (E, L, P, H, F))
+	conv_E_to_L = E[:, head_E].copy()
+	conv_L_to_P = L[:, head_L].copy()
+	conv_P_to_H = P[:, head_P].copy()
+	conv_H_to_F = H[:, head_H].copy()
+	conv_H_cum = state['cum_H'][:, head_H].copy()
+	conv_F_leave = F[:, head_F].copy()
+	conv_F_cum = state['cum_F'][:, head_F].copy()
+
+	E[:, head_E] = E_new
+	L[:, head_L] = conv_E_to_L
+	state['cum_L'][:, head_L] = 0.0
+	P[:, head_P] = conv_L_to_P
+	H[:, head_H] = conv_P_to_H
+	state['cum_H'][:, head_H] = 0.0
+	F[:, head_F] = conv_H_to_F
+	state['cum_F'][:, head_F] = conv_H_cum
+
+	state['total_E'] = total_E + E_new - conv_E_to_L
+	state['total_L'] = total_L + conv_E_to_L - conv_L_to_P
+	state['total_P'] = total_P + conv_L_to_P - conv_P_to_H
+	state['total_H'] = total_H + conv_P_to_H - conv_H_to_F
+	state['total_F'] = total_F + conv_H_to_F - conv_F_leave
+
+	if wintering:
+		# foragers reaching the end of their life over winter join the winter cohort
+		joining = season['winter'][:, k] * conv_F_leave
+		state['cum_W'] = np.divide(state['cum_W'] * W + conv_F_cum * joining, W + joining,
+								   out=np.zeros_like(W), where=W + joining > 0)
+		W += joining
+	return N
+
+
+def final_state(state, k, pesticide=False):
+	"""
+	Stage totals, population 'N', food 'S' and with pesticide 'Pest', 'Cp' and
+	the cumulative doses per cohort 'cum_L', 'cum_H', 'cum_F' (oldest cohort
+	first) of every scenario in state at the start of step k
+	"""
+	final = {stage: state[stage].sum(axis=1) for stage in STAGES}
+	final['N'] = sum(final[stage] for stage in STAGES) + state['W']
+	final['S'] = state['S']
+	if pesticide:
+		final.update(Pest=state['Pest'], Cp=state['Cp'])
+		for stage in ('L', 'H', 'F'):
+			cum = state[f'cum_{stage}']
+			final[f'cum_{stage}'] = np.roll(cum, -(k % cum.shape[1]), axis=1)
+	return final
+
+
+def state_snapshot(state, k):
+	"""
+	Copy of the state of every scenario at the start of step k as (B, columns)
+	arrays, cohorts oldest first: the 'population' (cohorts and W), the cohort
+	'doses', 'S', 'Pest', 'Cp' and the viable_adults 'flags'
+	"""
+	def aligned(key):
+		return np.roll(state[key], -(k % state[key].shape[1]), axis=1)
+	return {
+		'population': np.hstack([aligned(stage) for stage in STAGES] + [state['W'][:, None]]),
+		'doses': np.hstack([aligned(f'cum_{stage}') for stage in ('L', 'H', 'F')] + [state['cum_W'][:, None]]),
+		'S': state['S'][:, None].copy(),
+		'Pest': state['Pest'][:, None].copy(),
+		'Cp': state['Cp'][:, None].copy(),
+		'flags': np.stack([state['established'], state['collapsed']], axis=1).astype(float)
+	}
+
+
+def negligible_pesticide(params):
+	"""
+	Pesticide quantities that barely affect survival when scaled by a small
+	tolerance: LD50 for cohort doses and the store, and the concentration
+	giving a daily intake of LD50
+	"""
+	intake = np.maximum(np.maximum(params['c_L'], params['c_H']), params['c_F'])
+	return {'doses': params['LD50'], 'Pest': params['LD50'],
+			'Cp': np.divide(params['LD50'], intake, out=np.zeros_like(intake), where=intake > 0)}
+
+
+def settled_scenarios(snapshot, previous, params, tol, food_drift):
+	"""
+	True for the scenarios whose snapshot repeats the previous one to within
+	tol relative to the largest value of each state quantity, or to
+	negligible_pesticide for pesticide quantities. Where food_drift is True
+	the store S may instead grow by any amount (food did not limit survival,
+	so S has no effect until it does), and the pesticide store is left out
+	(its concentration Cp is negligible and can only fall as S grows).
+	"""
+	floors = negligible_pesticide(params)
+	settled = np.ones(len(params['LD50']), dtype=bool)
+	for key, values in snapshot.items():
+		scale = np.maximum(np.abs(previous[key]).max(axis=1), floors.get(key, 0))
+		repeats = np.all(np.abs(values - previous[key]) <= tol * scale[:, None], axis=1)
+		if key == 'S':
+			repeats |= food_drift & (values[:, 0] >= previous[key][:, 0])
+		elif key == 'Pest':
+			repeats |= food_drift
+		settled &= repeats
+	return settled
+
+
+def repeats_from(values, period, tol):
+	# first step from which every row of the (B, days) values repeats the row
+	# period steps earlier, to within tol relative to the largest value of the row
+	scale = tol * np.abs(values).max(axis=1, keepdims=True)
+	differs = np.abs(values[:, period:] - values[:, :-period]) > scale
+	last = differs.shape[1] - 1 - np.argmax(differs[:, ::-1], axis=1)
+	return np.where(differs.any(axis=1), last + 1 + period, period)
+
+
+def take_scenarios(values, index, batch):
+	# the scenarios in index of every (batch, ...) array in values, other entries unchanged
+	return {key: value[index] if isinstance(value, np.ndarray) and value.ndim and value.shape[0] == batch
+			and key not in STRUCTURAL_KEYS else value for key, value in values.items()}
+
+
+def simulate_batch(params, pesticide=False, record=RECORD_KEYS, exposure=None, season=None, record_every=1, rng=None,
+				   settle_every=None, settle_tol=1e-9):
+	"""
+	Run a batch of scenarios simultaneously. Any numeric parameter may be a
+	(B,) array (see scenario_grid); stage durations, T, start_day and the
+	recruitment mode are shared by the whole batch. exposure is a (days,) or
+	(B, days) daily concentration of pesticide in collected food (see
+	exposure.schedule_batch), by default the decaying pesticide_conc. season
+	holds daily laying and foraging multipliers (see advance), and
+	record_every keeps only every n-th day of the recorded trajectories.
+	With a numpy Generator rng every scenario is a stochastic replicate
+	(see advance), starting from whole individuals.
+
+	With settle_every (days, e.g. seasonal.YEAR for seasonal runs) the state
+	of every scenario is compared at checkpoints a period of
+	lcm(settle_every, record_every) days apart, counted back from the end of
+	the run. A scenario whose state repeats the previous checkpoint to within
+	settle_tol (see settled_scenarios), and whose exposure and season repeat
+	from then on, has settled on an equilibrium or a cycle: it is taken out
+	of the batch and its remaining days repeat the last period, with a food
+	store that grew over the period (food not limiting, pesticide negligible)
+	growing by the same amount every period. Long runs then only step the
+	scenarios that still change.
+
+	Returns a dict with 'days', a (B, days) array for each recorded
+	trajectory in record (stage totals 'E', 'L', 'P', 'H', 'F', population 'N',
+	food 'S', overwintering adults 'W' (see advance), and with pesticide
+	'Pest' (µg) and 'Cp' (µg/g)), the (B,) final
+	state in 'final' and, with pesticide, the final (B, duration) cumulative
+	doses per cohort 'cum_L', 'cum_H', 'cum_F' (µg/bee), oldest cohort first.
+	"""
+	days = np.arange(params['start_day'], params['T'])
+	if exposure is not None:
+		exposure = np.asarray(exposure, dtype=float)
+	params, batch = batch_parameters(params, 1 if exposure is None or exposure.ndim < 2 else exposure.shape[0])
+	if not pesticide:
+		record = tuple(key for key in record if key not in ('Pest', 'Cp'))
+	elif exposure is None:
+		exposure = concentration_schedule(params)
+	else:
+		exposure = np.broadcast_to(exposure, (batch, len(days)))
+
+	state = initial_state(params, batch)
+	if rng is not None:
+		for stage in STAGES:
+			state[stage] = np.round(state[stage])
+			state[f'total_{stage}'] = state[stage].sum(axis=1)
+	recorded_days = days[::record_every]
+	history = {key: np.zeros((batch, len(recorded_days))) for key in record}
+	final = {}
+
+	period = None if settle_every is None else int(np.lcm(settle_every, record_every))
+	if period is not None and rng is not None:
+		raise ValueError('settle_every needs a deterministic run (rng=None)')
+	if period is not None and period < len(days):
+		# first step from which the forcing of each scenario repeats
+		forcing_from = np.full(batch, period)
+		forcing = [exposure] if pesticide else []
+		forcing += [] if season is None else [np.asarray(value, dtype=float) for value in season.values()
+											   if np.ndim(value) == 2]
+		for values in forcing:
+			forcing_from = np.maximum(forcing_from, repeats_from(values, period, settle_tol))
+		if pesticide:
+			# first step from which exposure stays negligible
+			loud = exposure > settle_tol * negligible_pesticide(params)['Cp'][:, None]
+			quiet_from = np.where(loud.any(axis=1), len(days) - np.argmax(loud[:, ::-1], axis=1), 0)
+		food_limited = np.zeros(batch, dtype=bool)
+	else:
+		period = None
+	active, rows, previous = np.arange(batch), slice(None), None
+
+	for k in range(len(days)):
+		if period is not None and (len(days) - k) % period == 0:
+			snapshot = state_snapshot(state, k)
+			if previous is not None:
+				# a growing store has no effect while food is not limiting and pesticide is negligible
+				food_drift = ~food_limited
+				if pesticide:
+					negligible = settle_tol * negligible_pesticide(params)['Cp']
+					food_drift &= ((quiet_from[active] <= k) & (np.abs(snapshot['Cp'][:, 0]) <= negligible)
+								   & (np.abs(previous['Cp'][:, 0]) <= negligible))
+				settled = (forcing_from[active] <= k) & settled_scenarios(snapshot, previous, params, settle_tol, food_drift)
+				if settled.any():
+					index, keep = np.flatnonzero(settled), np.flatnonzero(~settled)
+					rows_settled = active[index]
+					# the remaining days repeat the last period, the store changing by the same amount every period
+					drift = (snapshot['S'] - previous['S'])[index, 0]
+					repeats = (len(days) - k) // period
+					for key, value in final_state(take_scenarios(state, index, len(active)), k, pesticide).items():
+						value = value + repeats * drift if key == 'S' else value
+						final.setdefault(key, np.zeros((batch,) + value.shape[1:]))[rows_settled] = value
+					first, length = -(-k // record_every), period // record_every
+					for key, values in history.items():
+						count = values.shape[1] - first
+						last_period = values[rows_settled, first - length:first]
+						values[rows_settled, first:] = np.tile(last_period, -(-count // length))[:, :count]
+						if key == 'S':
+							values[rows_settled, first:] += drift[:, None] * (1 + np.arange(count) // length)
+					state = take_scenarios(state, keep, len(active))
+					params = take_scenarios(params, keep, len(active))
+					if pesticide:
+						exposure = exposure[keep]
+					if season is not None:
+						season = take_scenarios(season, keep, len(active))
+					snapshot = {key: values[keep] for key, values in snapshot.items()}
+					active = rows = active[keep]
+					if not len(active):
+						break
+			previous = snapshot
+			food_limited = state['S'] < 0
+
+		# recorded values are the state at the start of the day, food after the update
+		totals = {stage: state[f'total_{stage}'] for stage in STAGES}
+		W = state['W'].copy()
+		N = advance(state, params, k, pesticide, exposure, season, rng)
+		if period is not None:
+			food_limited |= (state['eta'] < 1) | (state['S'] < 0)
+		if k % record_every == 0:
+			day = dict(totals, N=N, S=state['S'], Pest=state['Pest'], Cp=state['Cp'], W=W)
+			for key in record:
+				history[key][rows, k // record_every] = day[key]
+
+	if len(active):
+		for key, value in final_state(state, len(days), pesticide).items():
+			final.setdefault(key, np.zeros((batch,) + value.shape[1:]))[active] = value
+
+	result = dict(days=recorded_days, **history)
+	# final state, cumulative doses oldest cohort first
+	result['final'] = {key: value for key, value in final.items() if not key.startswith('cum_')}
+	result.update({key: value for key, value in final.items() if key.startswith('cum_')})
+	return result
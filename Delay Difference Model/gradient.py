@@ -0,0 +1,245 @@
+"""
+Forward-mode differentiable delay-difference model.
+
+Every state value carries a tangent: its derivative with respect to all
+numeric parameters in PARAMETER_KEYS. One pass of tangent_loop therefore
+returns the trajectories and their derivatives with respect to every
+parameter, in place of one extra run per parameter for finite
+differences. The loop is compiled with numba when it is installed
+(see kernel.py) and otherwise runs as plain NumPy.
+
+The default exposure (pesticide_conc decaying by d_factor) is differentiated
+with respect to pesticide_conc and half_life. An exposure array passed in
+is treated as a fixed input.
+"""
+import numpy as np
+
+from engine import STAGES
+from exposure import concentration_schedule
+from kernel import HISTORY_KEYS, njit
+
+# parameters carried as tangent directions, in column order
+PARAMETER_KEYS = ('initial_stage', 'K', 'daily_egg', 'female_ratio', 's_E', 's_L', 's_P', 's_H', 's_F',
+				  'food_collect_per_F', 'c_L', 'c_H', 'c_F', 'S0', 'pesticide', 'pesticide_conc',
+				  'half_life', 'hill_n', 'LD50')
+(INITIAL_STAGE, K_INDEX, DAILY_EGG, FEMALE_RATIO, S_E, S_L, S_P, S_H, S_F, FOOD_COLLECT,
+ C_L, C_H, C_F, S0_INDEX, PESTICIDE, PESTICIDE_CONC, HALF_LIFE, HILL_N, LD50_INDEX) = range(len(PARAMETER_KEYS))
+
+
+def tangent_loop(theta, durations, per_forager, exposure, dexposure, days, pesticide):
+	"""
+	Run the daily update of engine.simulate on values and tangents for days
+	steps with parameters theta (ordered as PARAMETER_KEYS).
+
+	Returns the (9, days) history and its (9, days, P) tangents (rows as
+	kernel.HISTORY_KEYS), the final stage totals and their tangents, the
+	final food store, pesticide and concentration and their tangents.
+	"""
+	P = theta.shape[0]
+	unit = np.eye(P)
+	width = durations.max()
+	survival = np.array([theta[S_E], theta[S_L], theta[S_P], theta[S_H], theta[S_F]])
+	survival_index = np.array([S_E, S_L, S_P, S_H, S_F])
+	consumption = np.array([theta[C_L], theta[C_H], theta[C_F]])
+	consumption_index = np.array([C_L, C_H, C_F])
+	K, daily_egg, female_ratio = theta[K_INDEX], theta[DAILY_EGG], theta[FEMALE_RATIO]
+	food_collect, LD50, hill_n = theta[FOOD_COLLECT], theta[LD50_INDEX], theta[HILL_N]
+
+	# ring buffers (oldest cohort at k % d) with tangents
+	queues = np.zeros((5, width))
+	dqueues = np.zeros((5, width, P))
+	for stage in range(5):
+		queues[stage, :durations[stage]] = theta[INITIAL_STAGE]
+		dqueues[stage, :durations[stage], INITIAL_STAGE] = 1.0
+	cums = np.zeros((3, width))
+	dcums = np.zeros((3, width, P))
+
+	S, dS = theta[S0_INDEX], unit[S0_INDEX].copy()
+	pest, dpest = theta[PESTICIDE], unit[PESTICIDE].copy()
+	Cp, dCp = 0.0, np.zeros(P)
+	d_factor = 0.5 ** (1 / theta[HALF_LIFE])
+	dd_factor = d_factor * np.log(2) / theta[HALF_LIFE] ** 2 * unit[HALF_LIFE]
+
+	history = np.zeros((9, days))
+	dhistory = np.zeros((9, days, P))
+	totals = np.zeros(5)
+	dtotals = np.zeros((5, P))
+
+	for k in range(days):
+		for stage in range(5):
+			totals[stage] = queues[stage, :durations[stage]].sum()
+			dtotals[stage] = dqueues[stage, :durations[stage]].sum(axis=0)
+		N = totals.sum()  # total population
+		dN = dtotals.sum(axis=0)
+
+		# new eggs per day, limited by the carrying capacity K
+		density = 1 - N / K
+		ddensity = -dN / K + N / K ** 2 * unit[K_INDEX]
+		if density <= 0:
+			density, ddensity = 0.0, np.zeros(P)
+		E_new = daily_egg * density
+		dE_new = unit[DAILY_EGG] * density + daily_egg * ddensity
+		if per_forager:
+			dE_new = (dE_new * totals[4] + E_new * dtotals[4]) * female_ratio + E_new * totals[4] * unit[FEMALE_RATIO]
+			E_new = E_new * totals[4] * female_ratio
+
+		# food comsumption
+		D = consumption[0] * totals[1] + consumption[1] * totals[3] + consumption[2] * totals[4]
+		dD = (unit[C_L] * totals[1] + consumption[0] * dtotals[1] + unit[C_H] * totals[3]
+			  + consumption[1] * dtotals[3] + unit[C_F] * totals[4] + consumption[2] * dtotals[4])
+		eta, deta = 1.0, np.zeros(P)
+		if D != 0:
+			eta = S / D
+			deta = dS / D - S / D ** 2 * dD
+			if eta >= 1:
+				eta, deta = 1.0, np.zeros(P)
+			elif eta <= 0:
+				eta, deta = 0.0, np.zeros(P)
+		if S < 0:
+			S, dS = 0.0, np.zeros(P)
+
+		# food remain
+		dS = dS + unit[FOOD_COLLECT] * totals[4] + food_collect * dtotals[4] - dD
+		S = S + food_collect * totals[4] - D
+
+		if pesticide:
+			# update pesticide changes
+			dpest = dpest * d_factor + pest * dd_factor
+			pest = pest * d_factor
+			new = exposure[k] * food_collect * totals[4]
+			dnew = (dexposure[k] * food_collect * totals[4] + exposure[k] * unit[FOOD_COLLECT] * totals[4]
+					+ exposure[k] * food_collect * dtotals[4])
+			consumed, dconsumed = 0.0, np.zeros(P)
+			if S > 0:
+				consumed = pest * D / S
+				dconsumed = (dpest * D + pest * dD) / S - pest * D / S ** 2 * dS
+			pest = pest - consumed + new
+			dpest = dpest - dconsumed + dnew
+			Cp, dCp = 0.0, np.zeros(P)  # pesticide concentration
+			if S > 0:
+				Cp = pest / S
+				dCp = dpest / S - pest / S ** 2 * dS
+
+		values = (totals[0], totals[1], totals[2], totals[3], totals[4], N, S, pest, Cp)
+		for row in range(9):
+			history[row, k] = values[row]
+		for row in range(5):
+			dhistory[row, k] = dtotals[row]
+		dhistory[5, k] = dN
+		dhistory[6, k] = dS
+		dhistory[7, k] = dpest
+		dhistory[8, k] = dCp
+
+		# survival, with food intake and Hill mortality for larvae, hive and forager
+		for stage in range(5):
+			duration = durations[stage]
+			q = queues[stage, :duration]
+			dq = dqueues[stage, :duration]
+			fed = stage == 1 or stage == 3 or stage == 4
+			factor = survival[stage]
+			dfactor = unit[survival_index[stage]].copy()
+			if fed:
+				dfactor = dfactor * eta + factor * deta
+				factor = factor * eta
+			if pesticide and fed:
+				dose_row = stage // 2  # L -> 0, H -> 1, F -> 2
+				c = consumption[dose_row]
+				cum = cums[dose_row, :duration]
+				dcum = dcums[dose_row, :duration]
+				cum += c * Cp
+				dcum += unit[consumption_index[dose_row]] * Cp + c * dCp
+				# survival after Hill mortality, 1 / (1 + (q / LD50) ** n)
+				ratio = cum / LD50
+				dratio = dcum / LD50 - np.outer(cum / LD50 ** 2, unit[LD50_INDEX])
+				positive = ratio > 0
+				safe = np.where(positive, ratio, 1.0)
+				power = np.where(positive, safe ** hill_n, 0.0)
+				slope = np.where(positive, hill_n * safe ** (hill_n - 1), 0.0)
+				log_ratio = np.where(positive, np.log(safe), 0.0)
+				dpower = slope[:, None] * dratio + np.outer(power * log_ratio, unit[HILL_N])
+				h = 1 + power
+				dq[:] = (dq * (factor / h)[:, None] + np.outer(q / h, dfactor)
+						 - (q * factor / h ** 2)[:, None] * dpower)
+				q *= factor / h
+			else:
+				dq[:] = dq * factor + np.outer(q, dfactor)
+				q *= factor
+
+		# transfer to next stage by overwriting the oldest cohort at each head
+		entering, dentering = E_new, dE_new
+		for stage in range(5):
+			head = k % durations[stage]
+			leaving, dleaving = queues[stage, head], dqueues[stage, head].copy()
+			queues[stage, head], dqueues[stage, head] = entering, dentering
+			entering, dentering = leaving, dleaving
+		head_L, head_H, head_F = k % durations[1], k % durations[3], k % durations[4]
+		cums[2, head_F], dcums[2, head_F] = cums[1, head_H], dcums[1, head_H]
+		cums[1, head_H], dcums[1, head_H] = 0.0, 0.0
+		cums[0, head_L], dcums[0, head_L] = 0.0, 0.0
+
+	for stage in range(5):
+		totals[stage] = queues[stage, :durations[stage]].sum()
+		dtotals[stage] = dqueues[stage, :durations[stage]].sum(axis=0)
+	return history, dhistory, totals, dtotals, S, dS, pest, dpest, Cp, dCp
+
+
+if njit is not None:
+	tangent_loop = njit(cache=True)(tangent_loop)
+
+
+def simulate_gradient(params, pesticide=False, exposure=None, wrt=PARAMETER_KEYS):
+	"""
+	Same trajectories as engine.simulate together with their derivatives with
+	respect to the parameters in wrt.
+
+	Returns the engine.simulate dict (without cumulative doses) plus
+	'wrt', 'gradient' with a (days, len(wrt)) array per trajectory and
+	'final_gradient' with a (len(wrt),) array per final value.
+	"""
+	unknown = set(wrt) - set(PARAMETER_KEYS)
+	if unknown:
+		raise KeyError(f'cannot differentiate with respect to {sorted(unknown)}')
+	theta = np.array([params[key] for key in PARAMETER_KEYS], dtype=float)
+	durations = np.array([params[f'dur_{stage}'] for stage in STAGES], dtype=np.int64)
+	days = np.arange(params['start_day'], params['T'])
+
+	dexposure = np.zeros((len(days), len(PARAMETER_KEYS)))
+	if exposure is None:
+		exposure = concentration_schedule(params)
+		# pesticide_conc * d_factor ** (k + 1)
+		dexposure[:, PESTICIDE_CONC] = exposure / params['pesticide_conc'] if params['pesticide_conc'] else \
+			0.5 ** ((np.arange(len(days)) + 1) / params['half_life'])
+		dexposure[:, HALF_LIFE] = exposure * (np.arange(len(days)) + 1) * np.log(2) / params['half_life'] ** 2
+	exposure = np.ascontiguousarray(exposure, dtype=float)
+
+	history, dhistory, totals, dtotals, S, dS, pest, dpest, Cp, dCp = tangent_loop(
+		theta, durations, params['recruitment'] == 'per_forager', exposure, dexposure, len(days), pesticide)
+
+	columns = [PARAMETER_KEYS.index(key) for key in wrt]
+	result = dict(days=days, **dict(zip(HISTORY_KEYS, history)))
+	result['gradient'] = {key: dhistory[row][:, columns] for row, key in enumerate(HISTORY_KEYS)}
+	result['final'] = dict(zip(STAGES, totals.tolist()), N=totals.sum(), S=S)
+	result['final_gradient'] = dict(zip(STAGES, dtotals[:, columns]), N=dtotals.sum(axis=0)[columns], S=dS[columns])
+	if pesticide:
+		result['final'].update(Pest=pest, Cp=Cp)
+		result['final_gradient'].update(Pest=dpest[columns], Cp=dCp[columns])
+	else:
+		for key in ('Pest', 'Cp'):
+			del result[key], result['gradient'][key]
+	result['wrt'] = tuple(wrt)
+	return result
+
+
+def sensitivity_table(params, pesticide=False, output='N', wrt=PARAMETER_KEYS):
+	"""
+	Local sensitivity of the final output to every parameter in wrt as
+	{name: (derivative, elasticity)}, the elasticity being the relative
+	change of the output per relative change of the parameter
+	"""
+	result = simulate_gradient(params, pesticide, wrt=wrt)
+	value = result['final'][output]
+	table = {}
+	for name, derivative in zip(wrt, result['final_gradient'][output]):
+		elasticity = derivative * params[name] / value if value else np.nan
+		table[name] = (derivative, elasticity)
+	return table
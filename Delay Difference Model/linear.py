@@ -0,0 +1,237 @@
+"""
+Linear (Leslie-form) formulation of the delay-difference model without pesticide.
+
+While food does not limit survival (eta = 1) and the carrying capacity does not
+clip recruitment, one day of the model is an affine map of the cohort vector
+(every queue slot, oldest cohort first, stage by stage), the food store S and a
+constant 1. The map is a sparse matrix, so long horizons are matrix powers and
+equilibrium / growth-rate analysis is sparse linear algebra. For constant
+recruitment the map is exact in that regime; for per-forager recruitment the
+1 - N / K factor is dropped, which is the low-density (Leslie) linearisation.
+"""
+import numpy as np
+from scipy import sparse
+from scipy.sparse import linalg
+
+from engine import STAGES, advance, batch_parameters, initial_state
+
+
+def stage_slices(params):
+	# position of each stage's cohorts in the state vector
+	slices, offset = {}, 0
+	for stage in STAGES:
+		duration = params[f'dur_{stage}']
+		slices[stage] = slice(offset, offset + duration)
+		offset += duration
+	return slices, offset
+
+
+def transition_matrix(params):
+	"""
+	Sparse (n + 2, n + 2) matrix A advancing [cohorts, S, 1] by one day with
+	eta = 1, where n is the total number of cohorts
+	"""
+	slices, n = stage_slices(params)
+	S_index, one_index = n, n + 1
+	A = sparse.lil_matrix((n + 2, n + 2))
+
+	# survival and ageing: cohort j moves to slot j - 1, the oldest cohort of a
+	# stage enters the newest slot of the next stage, foragers leave
+	previous = None
+	for stage in STAGES:
+		cohorts = range(slices[stage].start, slices[stage].stop)
+		survival = params[f's_{stage}']
+		for j in cohorts[1:]:
+			A[j - 1, j] = survival
+		if previous is not None:
+			A[cohorts[-1], previous[0]] = params[f's_{STAGES[STAGES.index(stage) - 1]}']
+		previous = cohorts
+
+	# recruitment into the newest egg slot
+	newest_egg = slices['E'].stop - 1
+	if params['recruitment'] == 'per_forager':
+		for j in range(slices['F'].start, slices['F'].stop):
+			A[newest_egg, j] = params['daily_egg'] * params['female_ratio']
+	else:
+		A[newest_egg, one_index] = params['daily_egg']
+		for j in range(n):
+			A[newest_egg, j] = -params['daily_egg'] / params['K']
+
+	# food balance: S + food_collect_per_F * F - D
+	A[S_index, S_index] = 1
+	for stage, coefficient in (('L', -params['c_L']), ('H', -params['c_H']),
+							   ('F', params['food_collect_per_F'] - params['c_F'])):
+		for j in range(slices[stage].start, slices[stage].stop):
+			A[S_index, j] = coefficient
+	A[one_index, one_index] = 1
+	return A.tocsr()
+
+
+def cohort_matrix(params):
+	# cohort block only (without food and constant)
+	n = stage_slices(params)[1]
+	return transition_matrix(params)[:n, :n]
+
+
+# dominant eigenpairs computed so far, by the parameters of the cohort block
+_EIGENPAIRS = {}
+
+
+def dominant_eigenpair(params):
+	"""
+	Dominant eigenvalue and eigenvector of the cohort block from a dense solve,
+	computed once per cohort block and shared by growth_rate and
+	stable_stage_distribution (the returned vector is read-only). For
+	per-forager recruitment the block is non-negative and this is the Perron
+	pair: the real eigenvalue with the largest real part and its eigenvector
+	scaled to be non-negative with unit sum. For constant recruitment it is
+	the (generally complex) eigenvalue of largest modulus.
+	"""
+	key = tuple((params[f'dur_{stage}'], params[f's_{stage}']) for stage in STAGES)
+	per_forager = params['recruitment'] == 'per_forager'
+	key += (per_forager, params['daily_egg'], params['female_ratio'] if per_forager else params['K'])
+	if key in _EIGENPAIRS:
+		return _EIGENPAIRS[key]
+	values, vectors = np.linalg.eig(cohort_matrix(params).toarray())
+	if per_forager:
+		real = np.flatnonzero(np.abs(values.imag) <= 1e-9 * np.maximum(1, np.abs(values)))
+		index = real[np.argmax(values[real].real)]
+		value, vector = values[index].real, vectors[:, index].real
+		vector = vector / vector.sum()
+	else:
+		index = np.argmax(np.abs(values))
+		value, vector = values[index], vectors[:, index]
+	vector.setflags(write=False)
+	_EIGENPAIRS[key] = value, vector
+	return value, vector
+
+
+def growth_rate(params):
+	"""
+	Daily growth factor at low density for per-forager recruitment (the Perron
+	root of the cohort transition), or the rate of convergence to the
+	equilibrium for constant recruitment (the modulus of its dominant
+	eigenvalue), as a float
+	"""
+	value = dominant_eigenpair(params)[0]
+	return float(value.real if params['recruitment'] == 'per_forager' else abs(value))
+
+
+def stable_stage_distribution(params):
+	"""
+	Fraction of the population in each stage: the dominant eigenvector for
+	per-forager recruitment, the equilibrium for constant recruitment
+	"""
+	if params['recruitment'] != 'per_forager':
+		totals = equilibrium(params)
+		return {stage: totals[stage] / totals['N'] for stage in STAGES}
+	vector = dominant_eigenpair(params)[1]
+	slices = stage_slices(params)[0]
+	return {stage: vector[slices[stage]].sum() for stage in STAGES}
+
+
+def equilibrium(params):
+	"""
+	Stage totals at the fixed point of the constant-recruitment model while
+	food is not limiting, solving (I - A) x = b with the sparse cohort block
+	"""
+	if params['recruitment'] == 'per_forager':
+		raise ValueError('per-forager recruitment has no linear equilibrium, see growth_rate()')
+	slices, n = stage_slices(params)
+	A = transition_matrix(params)
+	b = A[:n, n + 1].toarray().ravel()
+	x = linalg.spsolve((sparse.identity(n) - A[:n, :n]).tocsc(), b)
+	totals = {stage: x[slices[stage]].sum() for stage in STAGES}
+	totals['N'] = x.sum()
+	return totals
+
+
+def matrix_power(A, power):
+	# repeated squaring
+	result = sparse.identity(A.shape[0], format='csr')
+	while power:
+		if power & 1:
+			result = result @ A
+		A = A @ A
+		power >>= 1
+	return result
+
+
+def initial_vector(params):
+	n = stage_slices(params)[1]
+	x = np.full(n + 2, float(params['initial_stage']))
+	x[n], x[n + 1] = params['S0'], 1.0
+	return x
+
+
+def binds(params, x, tol=0.01):
+	"""
+	True when the linear map is not valid at state x: food limits survival
+	(S < D), or recruitment is clipped by K (constant recruitment) or
+	noticeably reduced by it (per-forager recruitment, N > tol * K)
+	"""
+	slices, n = stage_slices(params)
+	totals = {stage: x[slices[stage]].sum() for stage in STAGES}
+	N = x[:n].sum()
+	D = params['c_L'] * totals['L'] + params['c_H'] * totals['H'] + params['c_F'] * totals['F']
+	if x[n] < D:
+		return True
+	if params['recruitment'] == 'per_forager':
+		return N > tol * params['K']
+	return N > params['K']
+
+
+def step_nonlinear(params, x, days):
+	# advance the vector state with the daily engine update
+	slices, n = stage_slices(params)
+	batched, batch = batch_parameters(params)
+	state = initial_state(batched, batch)
+	for stage in STAGES:
+		state[stage][0] = x[slices[stage]]
+		state[f'total_{stage}'] = state[stage].sum(axis=1)
+	state['S'] = np.array([x[n]])
+	for k in range(days):
+		advance(state, batched, k)
+	x = x.copy()
+	for stage in STAGES:
+		x[slices[stage]] = np.roll(state[stage][0], -(days % params[f'dur_{stage}']))
+	x[n] = state['S'][0]
+	return x
+
+
+def project(params, days=None, check_every=30, tol=0.01):
+	"""
+	Project the no-pesticide model over days (default T - start_day) in jumps of
+	check_every days with the linear operator, switching back to nonlinear
+	daily stepping for any jump whose start or end state binds (see binds()).
+
+	Returns a dict with the checkpoint 'days', population 'N' and food 'S'
+	at each checkpoint, the final stage totals in 'final' and the number
+	of days advanced by the linear operator in 'linear_days'.
+	"""
+	if days is None:
+		days = params['T'] - params['start_day']
+	slices, n = stage_slices(params)
+	A = transition_matrix(params)
+	jump = matrix_power(A, check_every)
+
+	x = initial_vector(params)
+	checkpoints, N, S = [0], [x[:n].sum()], [x[n]]
+	day, linear_days = 0, 0
+	while day < days:
+		length = min(check_every, days - day)
+		trial = (jump if length == check_every else matrix_power(A, length)) @ x
+		if binds(params, x, tol) or binds(params, trial, tol):
+			x = step_nonlinear(params, x, length)
+		else:
+			x = trial
+			linear_days += length
+		day += length
+		checkpoints.append(day)
+		N.append(x[:n].sum())
+		S.append(x[n])
+
+	final = {stage: x[slices[stage]].sum() for stage in STAGES}
+	final.update(N=x[:n].sum(), S=x[n])
+	return {'days': np.array(checkpoints), 'N': np.array(N), 'S': np.array(S),
+			'final': final, 'linear_days': linear_days}
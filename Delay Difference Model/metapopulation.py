@@ -0,0 +1,134 @@
+"""
+Spatial metapopulation of delay-difference colonies.
+
+Patches are the scenario axis of the batched engine, so every stage is held
+as an (n_patches, duration) array and any numeric parameter may vary by
+patch. Patches are coupled through a sparse, row-stochastic neighbour
+matrix W (W[i, j] is the share of patch i's foraging and emigration going
+to patch j):
+
+- shared forage: the foraging demand of every colony is spread over its
+  neighbourhood and each patch supplies at most its forage (g/day), so
+  colonies competing for the same patches collect less
+- local exposure: each colony collects food at the pesticide
+  concentration of the patches it forages on, weighted by what it collects
+- dispersal: a fraction of every forager cohort emigrates each day to
+  neighbouring colonies, carrying its pesticide dose
+
+Each coupling step is a sparse matrix multiply.
+"""
+import numpy as np
+from scipy import sparse
+
+from engine import STAGES, advance, batch_parameters, initial_state
+from exposure import concentration_schedule
+
+
+def grid_neighbours(rows, cols, radius=1, include_self=True):
+	"""
+	Row-stochastic sparse (rows * cols, rows * cols) matrix sharing each patch
+	of a rectangular grid equally among the patches within radius (Chebyshev
+	distance), patch index = row * cols + col
+	"""
+	row, col = np.divmod(np.arange(rows * cols), cols)
+	sources, targets = [], []
+	for dr in range(-radius, radius + 1):
+		for dc in range(-radius, radius + 1):
+			if dr == 0 and dc == 0 and not include_self:
+				continue
+			inside = (row + dr >= 0) & (row + dr < rows) & (col + dc >= 0) & (col + dc < cols)
+			sources.append(np.flatnonzero(inside))
+			targets.append((row[inside] + dr) * cols + col[inside] + dc)
+	sources, targets = np.concatenate(sources), np.concatenate(targets)
+	W = sparse.csr_matrix((np.ones(len(sources)), (sources, targets)), shape=(rows * cols, rows * cols))
+	return sparse.diags(1 / np.asarray(W.sum(axis=1)).ravel()) @ W
+
+
+def share_forage(W, demand, forage, concentration):
+	"""
+	Fraction of its demand each colony collects and the concentration of what
+	it collects, when patch j supplies at most forage[j] to the demand spread
+	onto it (W.T @ demand)
+	"""
+	pressure = W.T @ demand
+	supply = np.minimum(1.0, np.divide(forage, pressure, out=np.ones_like(pressure), where=pressure > 0))
+	collected = W @ supply
+	contaminated = W @ (supply * concentration)
+	return collected, np.divide(contaminated, collected, out=np.zeros_like(collected), where=collected > 0)
+
+
+def disperse(state, W, dispersal):
+	# move a fraction of every forager cohort to neighbouring colonies,
+	# mixing the pesticide doses of the cohorts they join
+	F, cum_F = state['F'], state['cum_F']
+	migrants = dispersal * F
+	arriving = W.T @ migrants
+	dose = W.T @ (migrants * cum_F)
+	staying = F - migrants
+	F_new = staying + arriving
+	state['cum_F'] = np.divide(staying * cum_F + dose, F_new, out=np.zeros_like(F_new), where=F_new > 0)
+	state['F'] = F_new
+	state['total_F'] = F_new.sum(axis=1)
+
+
+def simulate_metapopulation(params, W, forage=np.inf, exposure=None, dispersal=0.0, pesticide=False,
+							record=('N',), record_every=1):
+	"""
+	Run one colony per patch of the neighbour matrix W (see grid_neighbours)
+	with params given as scalars or (n_patches,) arrays.
+
+	forage is the food (g/day) each patch can supply, scalar or (n_patches,),
+	exposure the pesticide concentration in the forage of each patch as a
+	(n_patches,) or (n_patches, days) array (default: the decaying
+	pesticide_conc everywhere) and dispersal the daily emigrating fraction
+	of foragers.
+
+	Returns a dict with 'days', a (n_patches, days) array for each recorded
+	trajectory (as engine.simulate_batch), the (n_patches,) final state in
+	'final' and the landscape totals 'total_N' per recorded day.
+	"""
+	n = W.shape[0]
+	W = sparse.csr_matrix(W)
+	days = np.arange(params['start_day'], params['T'])
+	params, batch = batch_parameters(params, n)
+	if batch != n:
+		raise ValueError(f'patch parameters must have length {n}, got {batch}')
+
+	if exposure is None:
+		exposure = concentration_schedule(params)
+	exposure = np.asarray(exposure, dtype=float)
+	if exposure.ndim == 1:
+		exposure = exposure[:, None]
+	exposure = np.broadcast_to(exposure, (n, len(days)))
+	forage = np.broadcast_to(np.asarray(forage, dtype=float), (n,))
+	if not pesticide:
+		record = tuple(key for key in record if key not in ('Pest', 'Cp'))
+
+	# today's foraging multiplier and collected concentration for engine.advance
+	season = {'laying': np.ones((1, len(days))), 'foraging': np.ones((n, len(days)))}
+	collected_exposure = np.zeros((n, len(days)))
+
+	state = initial_state(params, n)
+	recorded_days = days[::record_every]
+	history = {key: np.zeros((n, len(recorded_days))) for key in record}
+	for k in range(len(days)):
+		demand = params['food_collect_per_F'] * state['total_F']
+		season['foraging'][:, k], collected_exposure[:, k] = share_forage(W, demand, forage, exposure[:, k])
+		totals = {stage: state[f'total_{stage}'] for stage in STAGES}
+		N = advance(state, params, k, pesticide, collected_exposure, season)
+		if dispersal:
+			disperse(state, W, dispersal)
+		if k % record_every == 0:
+			day = dict(totals, N=N, S=state['S'], Pest=state['Pest'], Cp=state['Cp'])
+			for key in record:
+				history[key][:, k // record_every] = day[key]
+
+	result = dict(days=recorded_days, **history)
+	result['final'] = {stage: state[stage].sum(axis=1) for stage in STAGES}
+	result['final']['N'] = sum(result['final'][stage] for stage in STAGES)
+	result['final']['S'] = state['S']
+	if pesticide:
+		result['final'].update(Pest=state['Pest'], Cp=state['Cp'])
+	if 'N' in history:
+		result['total_N'] = history['N'].sum(axis=0)
+	return result
@@ -0,0 +1,63 @@
+import sys
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+# Registry reader shared with the agent-based model (repository root)
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+	sys.path.append(str(ROOT))
+from species_registry import REGISTRY_PATH, SPECIES, read_registry
+
+# Integer-valued constants (simulation length and stage delay days)
+INTEGER_KEYS = ('T', 'start_day', 'dur_E', 'dur_L', 'dur_P', 'dur_H', 'dur_F')
+# Non-numeric constants
+LABEL_KEYS = ('recruitment',)
+
+
+def compile_registry(registry):
+	"""
+	Compile the delay-difference block of every species into flat arrays
+	indexed by species id, e.g. compiled['K'][species_id]
+	"""
+	blocks = [dict(registry[name]['delay_difference'], LD50=registry[name]['ld50']) for name in SPECIES]
+	compiled = {}
+	for key in blocks[0]:
+		values = [block[key] for block in blocks]
+		if key in LABEL_KEYS:
+			compiled[key] = np.array(values)
+		elif key in INTEGER_KEYS:
+			compiled[key] = np.array(values, dtype=int)
+		else:
+			compiled[key] = np.array(values, dtype=float)
+	return compiled
+
+
+@lru_cache(maxsize=None)
+def _compiled_registry(path):
+	return compile_registry(read_registry(path))
+
+
+def load_registry(path=REGISTRY_PATH):
+	"""
+	Compiled registry (see compile_registry), cached per path so parameter
+	sweeps calling load_species do not re-read the file. The arrays are
+	shared between calls and must not be modified.
+	"""
+	return _compiled_registry(Path(path))
+
+
+def load_species(name, path=REGISTRY_PATH, **overrides):
+	"""
+	Return the delay-difference constants of one species as a dict of scalars,
+	with keyword overrides for parameter sweeps (e.g. load_species('honeybee', K=50000))
+	"""
+	compiled = load_registry(path)
+	species_id = SPECIES.index(name)
+	params = {key: values[species_id].item() for key, values in compiled.items()}
+	for key, value in overrides.items():
+		if key not in params:
+			raise KeyError(f'unknown delay-difference parameter: {key}')
+		params[key] = value
+	return params
@@ -0,0 +1,69 @@
+"""
+Regression check of the delay-difference engine against the original
+stand-alone species scripts.
+
+regression_baseline.npz holds the daily trajectories E, L, P, H, F, N, S
+(and Pest with pesticide) that the original honeybee, bumble bee and solitary
+bee scripts produced before they were moved onto engine.py, keyed
+'<species>/<key>' without and '<species>/pesticide/<key>' with pesticide.
+One line of the original solitary bee pesticide run differs from the engine
+on purpose: it limited recruitment by the final population of the run
+without pesticide (N instead of N_p), so its baseline was produced with that
+line corrected.
+
+python regression.py runs every species with and without pesticide through
+each available backend of engine.simulate and through engine.simulate_batch,
+prints the largest relative error of each run and exits with status 1 when
+any exceeds the tolerance.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from engine import simulate, simulate_batch
+from kernel import JIT_AVAILABLE
+from parameters import load_species
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'regression_baseline.npz'
+
+
+def relative_error(result, baseline, prefix):
+	# largest relative error over every baseline trajectory under prefix
+	keys = [name[len(prefix):] for name in baseline.files
+			if name.startswith(prefix) and '/' not in name[len(prefix):]]
+	return max(np.max(np.abs(np.ravel(result[key]) - baseline[prefix + key])
+					  / np.maximum(np.abs(baseline[prefix + key]), 1e-12)) for key in keys)
+
+
+def check(path=BASELINE_PATH, species=('honeybee', 'bumblebee', 'solitary')):
+	"""
+	Largest relative error against the baseline of every species, pesticide
+	setting and backend ('numpy', 'jit' when numba is installed and 'batch'),
+	as a dict keyed (species, pesticide, backend)
+	"""
+	backends = ('numpy', 'jit') if JIT_AVAILABLE else ('numpy',)
+	errors = {}
+	with np.load(path) as baseline:
+		for name in species:
+			params = load_species(name)
+			for pesticide in (False, True):
+				prefix = f'{name}/pesticide/' if pesticide else f'{name}/'
+				for backend in backends:
+					result = simulate(params, pesticide, backend=backend)
+					errors[name, pesticide, backend] = relative_error(result, baseline, prefix)
+				errors[name, pesticide, 'batch'] = relative_error(simulate_batch(params, pesticide), baseline, prefix)
+	return errors
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Compare the engine with the original species scripts')
+	parser.add_argument('--tol', type=float, default=1e-12, help='largest accepted relative error')
+	args = parser.parse_args()
+
+	errors = check()
+	for (name, pesticide, backend), error in errors.items():
+		print(f"{name:<10} {'pesticide' if pesticide else 'control':<10} {backend:<6} {error:.1e}"
+			  f"{'' if error <= args.tol else '  FAILED'}")
+	sys.exit(int(max(errors.values()) > args.tol))
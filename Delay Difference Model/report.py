@@ -0,0 +1,221 @@
+"""
+Printing, saving and plotting of delay-difference results for the species scripts.
+
+Figures are only drawn when asked for: with --output the scripts write the
+trajectories to disk and, with --figures, render the figures to PNG in a
+background process. LaTeX text is used when a latex binary is installed,
+otherwise (or with --mathtext) matplotlib's built-in mathtext.
+"""
+import argparse
+import multiprocessing
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+# make latex font
+LATEX_STYLE = {
+	"text.usetex": True,
+	"font.family": "serif",
+	"font.serif": ["Times New Roman","Times","Palatino", "serif"],
+	"font.size": 24,
+	"legend.fontsize": 19
+}
+
+# same look without a LaTeX installation
+MATHTEXT_STYLE = dict(LATEX_STYLE, **{
+	"text.usetex": False,
+	"font.serif": ["Times New Roman", "Times", "STIXGeneral", "DejaVu Serif"],
+	"mathtext.fontset": "stix"
+})
+
+FIGURE_SIZE = (12, 8)
+
+
+def latex_available():
+	return shutil.which('latex') is not None
+
+
+def figure_style(mathtext=False):
+	return MATHTEXT_STYLE if mathtext or not latex_available() else LATEX_STYLE
+
+
+def print_summary(base, pest, labels=('Hive', 'Forager')):
+	hive_label, forager_label = labels
+
+	final = base['final']
+	print("[Original Model] Final Population in Each Stage:")
+	print(f"Egg: {final['E']:.2f}")
+	print(f"Larvae: {final['L']:.2f}")
+	print(f"Pupae: {final['P']:.2f}")
+	print(f"{hive_label}: {final['H']:.2f}")
+	print(f"{forager_label}: {final['F']:.2f}")
+	print(f"Total Population (N): {final['N']:.2f}")
+	print(f"Remaining Food (S): {final['S']:.2f} g")
+
+	# Pesticide intake
+	avg_larvae = np.mean(pest['cum_L']) if len(pest['cum_L']) > 0 else 0
+	avg_hive = np.mean(pest['cum_H']) if len(pest['cum_H']) > 0 else 0
+	avg_forager = np.mean(pest['cum_F']) if len(pest['cum_F']) > 0 else 0
+
+	final = pest['final']
+	print("\n[With Pesticide Impact] Final Population in Each Stage:")
+	print(f"Egg: {final['E']:.2f}")
+	print(f"Larvae: {final['L']:.2f}  (Avg cumulative pesticide: {avg_larvae:.4f} µg/bee)")
+	print(f"Pupae: {final['P']:.2f}")
+	print(f"{hive_label}: {final['H']:.2f}  (Avg cumulative pesticide: {avg_hive:.4f} µg/bee)")
+	print(f"{forager_label}: {final['F']:.2f}  (Avg cumulative pesticide: {avg_forager:.4f} µg/bee)")
+	print(f"Total Population (N): {final['N']:.2f}")
+	print(f"Remaining Food (S): {final['S']:.2f} g")
+	print(f"Total Pesticide in Food: {final['Pest']:.4f} µg, Pesticide Concentration: {final['Cp']:.6f} µg/g")
+
+
+def save_results(path, base, pest):
+	"""
+	Write both runs to a single .npz file, arrays as '<run>_<key>' and the
+	final state as '<run>_final_<key>' for run in ('base', 'pest')
+	"""
+	arrays = {}
+	for run, result in (('base', base), ('pest', pest)):
+		for key, value in result.items():
+			if key == 'final':
+				arrays.update({f'{run}_final_{stage}': value for stage, value in value.items()})
+			else:
+				arrays[f'{run}_{key}'] = value
+	np.savez(path, **arrays)
+	return Path(path)
+
+
+def load_results(path):
+	# inverse of save_results, returns (base, pest)
+	runs = {'base': {'final': {}}, 'pest': {'final': {}}}
+	with np.load(path) as data:
+		for name in data.files:
+			run, key = name.split('_', 1)
+			if key.startswith('final_'):
+				runs[run]['final'][key[len('final_'):]] = data[name].item()
+			else:
+				runs[run][key] = data[name]
+	return runs['base'], runs['pest']
+
+
+def plot_stages(fig, result, title, labels=('Hive', 'Forager'), ylim=None):
+	ax = fig.subplots()
+	for stage, label in zip(('E', 'L', 'P', 'H', 'F'), ('Egg', 'Larvae', 'Pupae') + tuple(labels)):
+		ax.plot(result['days'], result[stage], label=label)
+	ax.set_xlabel("Days")
+	ax.set_ylabel("Population")
+	ax.set_title(title)
+	ax.legend()
+	ax.grid(True)
+	if ylim is not None:
+		ax.set_ylim(*ylim)
+	fig.tight_layout()
+
+
+def plot_total(fig, base, pest, title, legend_loc='lower right'):
+	ax = fig.subplots()
+	ax.plot(base['days'], base['N'], label='Total Population (Without Pesticide)', linewidth=2)
+	ax.plot(pest['days'], pest['N'], label='Total Population (With Pesticide)', linewidth=2)
+	ax.set_xlabel("Days")
+	ax.set_ylabel("Total Population")
+	ax.set_title(title)
+	ax.legend(loc = legend_loc)
+	ax.grid(True)
+	fig.tight_layout()
+
+
+def draw_figures(new_figure, base, pest, name, labels=('Hive', 'Forager'), ylim=None, legend_loc='lower right'):
+	# the three result figures, keyed by file stem
+	figures = {}
+	figures['stages'] = new_figure()
+	plot_stages(figures['stages'], base, f"{name} Population Dynamics Across Stages (Without Pesticide)", labels, ylim)
+	figures['stages_pesticide'] = new_figure()
+	plot_stages(figures['stages_pesticide'], pest, f"{name} Population Dynamics Across Stages (With Pesticide)", labels, ylim)
+	figures['total'] = new_figure()
+	plot_total(figures['total'], base, pest, f"Comparison of Total {name} Population", legend_loc)
+	return figures
+
+
+def plot_results(base, pest, name, labels=('Hive', 'Forager'), ylim=None, legend_loc='lower right', mathtext=False):
+	# interactive display
+	import matplotlib.pyplot as plt
+
+	plt.rcParams.update(figure_style(mathtext))
+	draw_figures(lambda: plt.figure(figsize=FIGURE_SIZE), base, pest, name, labels, ylim, legend_loc)
+	plt.show()
+
+
+def render_figures(path, output, name, labels=('Hive', 'Forager'), ylim=None, legend_loc='lower right', mathtext=False):
+	"""
+	Render the figures of a save_results file to PNG files in output without
+	pyplot or a display
+	"""
+	import matplotlib
+	from matplotlib.figure import Figure
+
+	base, pest = load_results(path)
+	output = Path(output)
+	output.mkdir(parents=True, exist_ok=True)
+	stem = Path(path).stem
+	with matplotlib.rc_context(figure_style(mathtext)):
+		figures = draw_figures(lambda: Figure(figsize=FIGURE_SIZE), base, pest, name, labels, ylim, legend_loc)
+		for key, fig in figures.items():
+			fig.savefig(output / f'{stem}_{key}.png')
+	return [output / f'{stem}_{key}.png' for key in figures]
+
+
+def render_in_background(path, output, name, **options):
+	# start render_figures in a separate process and return it (call join() to wait)
+	process = multiprocessing.get_context('spawn').Process(
+		target=render_figures, args=(path, output, name), kwargs=options)
+	process.start()
+	return process
+
+
+def argument_parser(description):
+	parser = argparse.ArgumentParser(description=description)
+	parser.add_argument('--output', type=Path, default=None,
+						help='write the trajectories to this directory instead of showing figures')
+	parser.add_argument('--figures', action='store_true',
+						help='with --output, also render PNG figures in a background process')
+	parser.add_argument('--mathtext', action='store_true',
+						help='use matplotlib mathtext instead of LaTeX for figure text')
+	return parser
+
+
+def report(base, pest, name, args, labels=('Hive', 'Forager'), ylim=None, legend_loc='lower right'):
+	"""
+	Print the summary, then either show the figures or (with --output) save the
+	trajectories and optionally render the figures in the background
+	"""
+	print_summary(base, pest, labels)
+	options = dict(labels=labels, ylim=ylim, legend_loc=legend_loc, mathtext=args.mathtext)
+	if args.output is None:
+		plot_results(base, pest, name, **options)
+		return None
+
+	args.output.mkdir(parents=True, exist_ok=True)
+	path = save_results(args.output / f"{name.lower().replace(' ', '_')}.npz", base, pest)
+	print(f"\nTrajectories written to {path}")
+	if args.figures:
+		return render_in_background(path, args.output, name, **options)
+	return None
+
+
+if __name__ == '__main__':
+	# render figures from a saved file on request, e.g. python report.py out/honey_bee.npz "Honey Bee"
+	parser = argparse.ArgumentParser(description='Render the figures of saved delay-difference results')
+	parser.add_argument('path', type=Path)
+	parser.add_argument('name')
+	parser.add_argument('--labels', nargs=2, default=('Hive', 'Forager'))
+	parser.add_argument('--ylim', nargs=2, type=float, default=None, metavar=('LOW', 'HIGH'),
+						help='y range of the stage figures, e.g. 0 18750 as in honeybee.py')
+	parser.add_argument('--legend-loc', default='lower right',
+						help="legend position of the total population figure, e.g. 'lower left' as in solitary bee.py")
+	parser.add_argument('--output', type=Path, default=None)
+	parser.add_argument('--mathtext', action='store_true')
+	args = parser.parse_args()
+	for file in render_figures(args.path, args.output or args.path.parent, args.name, tuple(args.labels),
+							   ylim=args.ylim, legend_loc=args.legend_loc, mathtext=args.mathtext):
+		print(file)
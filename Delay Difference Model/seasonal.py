@@ -0,0 +1,73 @@
+"""
+Multi-year runs of the delay-difference model with seasonal laying and
+foraging and overwintering.
+
+Seasonality enters the batched engine as daily multipliers of daily_egg
+(laying curve) and food_collect_per_F (foraging season, zero over winter),
+computed once per day of the year and indexed for every day of the run.
+Adults carry the colony over winter: outside the foraging season foragers
+that reach the end of their forager life join a winter cohort W with the
+extended daily survival winter_survival, feeding on the store. W forages
+again when the season restarts, now at the forager survival s_F, and dies
+off while the brood of the new laying season takes over (per-forager
+recruitment restarts from it).
+Without a winter cohort (winter_survival=None) the adults die out over
+winter and constant-recruitment colonies restart from zero every spring.
+Food and pesticide stores simply carry over from one year to the next.
+"""
+import numpy as np
+
+from engine import RECORD_KEYS, simulate_batch
+
+YEAR = 365  # days
+
+
+def laying_profile(day_of_year, start=60, end=300):
+	# smooth laying curve: zero before start and after end, peaking mid-season
+	phase = (np.asarray(day_of_year) - start) / (end - start)
+	return np.where((phase >= 0) & (phase <= 1), np.sin(np.pi * np.clip(phase, 0, 1)) ** 2, 0.0)
+
+
+def foraging_profile(day_of_year, start=75, end=290):
+	# foragers collect food between start and end and stay in over winter
+	day_of_year = np.asarray(day_of_year)
+	return ((day_of_year >= start) & (day_of_year < end)).astype(float)
+
+
+def season_profiles(start_day, days, laying=(60, 300), foraging=(75, 290), winter_survival=None):
+	"""
+	Daily multipliers for engine.advance as (1, days) arrays, from the
+	(start, end) day of year of the laying and foraging seasons. With a
+	daily winter_survival it also holds the 'winter' (no foraging) day flags
+	of the winter cohort.
+	"""
+	day_of_year = np.arange(YEAR)
+	index = (start_day + np.arange(days)) % YEAR
+	season = {
+		'laying': laying_profile(day_of_year, *laying)[index][None, :],
+		'foraging': foraging_profile(day_of_year, *foraging)[index][None, :]
+	}
+	if winter_survival is not None:
+		season['winter'] = 1 - season['foraging']
+		season['winter_survival'] = winter_survival
+	return season
+
+
+def simulate_years(params, years, pesticide=False, record=RECORD_KEYS, exposure=None,
+				   record_every=1, laying=(60, 300), foraging=(75, 290), winter_survival=0.995, settle_tol=None):
+	"""
+	Run params (scalars or (B,) scenario arrays, see engine.simulate_batch)
+	for years consecutive years starting at start_day, with the laying and
+	foraging seasons given as (start, end) days of the year and the daily
+	survival of the winter cohort winter_survival (None: no overwintering,
+	winter resets constant-recruitment colonies).
+	For long batches use record_every (e.g. 7 or YEAR) to thin the recorded
+	trajectories, e.g.
+	simulate_years(scenario_grid(params, K=...), 20, record=('N', 'S'), record_every=7)
+	and settle_tol (e.g. 1e-9) to stop stepping scenarios once their yearly
+	cycle repeats to within that relative tolerance (see engine.simulate_batch).
+	"""
+	params = dict(params, T=params['start_day'] + years * YEAR)
+	season = season_profiles(params['start_day'], years * YEAR, laying, foraging, winter_survival)
+	return simulate_batch(params, pesticide, record, exposure, season, record_every,
+						  settle_every=None if settle_tol is None else YEAR, settle_tol=settle_tol)
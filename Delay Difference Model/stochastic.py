@@ -0,0 +1,64 @@
+"""
+Stochastic (demographic noise) delay-difference model.
+
+Replicates are the scenario axis of the batched engine: every cohort
+survives as a binomial draw and recruitment is a Poisson draw, so small
+populations (bumble bee K = 860, solitary K = 350) can go extinct. Colonies
+with constant recruitment keep laying regardless of their adults; with the
+optional viable_adults threshold a replicate whose adults fall below it after
+having reached it counts as collapsed and stops recruiting (quasi-extinction).
+The extinction probability depends strongly on that threshold, so it is off
+by default.
+The only Python loop is over days.
+"""
+import numpy as np
+
+from engine import batch_parameters, simulate_batch
+
+
+def simulate_replicates(params, replicates, pesticide=False, seed=None, record=('N',), viable_adults=None, **options):
+	"""
+	Run replicates independent stochastic realisations of params (scalars, or
+	(replicates,) arrays) with numpy's default generator seeded by seed.
+	viable_adults is an optional quasi-extinction threshold on hive bees,
+	foragers and winter bees (a scalar or (replicates,) array, default None:
+	colonies never stop recruiting).
+	Further options (exposure, season, record_every) are passed to
+	engine.simulate_batch, whose result is returned.
+	"""
+	if viable_adults is not None:
+		params = dict(params, viable_adults=viable_adults)
+	params, _ = batch_parameters(params, replicates)
+	return simulate_batch(params, pesticide, record, rng=np.random.default_rng(seed), **options)
+
+
+def extinction_times(result, threshold=1, key='N'):
+	"""
+	Day from which result[key] stays below threshold until the end of the run
+	for each replicate, nan for replicates above threshold on the last
+	recorded day. With constant recruitment and no viable_adults eggs keep
+	arriving, so use key='F' (recorded) for the loss of all adults instead.
+	"""
+	below = result[key] < threshold
+	# start of the final run of days below threshold
+	start = below.shape[1] - np.argmax(~below[:, ::-1], axis=1)
+	start = np.where(below.all(axis=1), 0, start)
+	return np.where(below[:, -1], result['days'][np.minimum(start, below.shape[1] - 1)], np.nan)
+
+
+def extinction_summary(result, threshold=1, key='N', quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+	"""
+	Extinction probability over the run, quantiles of the extinction time
+	among extinct replicates and the fraction of replicates not yet extinct
+	on every recorded day
+	"""
+	times = extinction_times(result, threshold, key)
+	extinct = ~np.isnan(times)
+	surviving = (result['days'][None, :] < np.where(extinct, times, np.inf)[:, None]).mean(axis=0)
+	return {
+		'probability': extinct.mean(),
+		'quantiles': dict(zip(quantiles, np.quantile(times[extinct], quantiles))) if extinct.any() else {},
+		'days': result['days'],
+		'surviving': surviving,
+		'times': times
+	}
@@ -1,3 +1,6 @@
+import argparse
+import time
+
 import pandas as pd
 import numpy as np
 import pymc as pm
@@ -32,79 +35,233 @@ def generate_fake_data(n_sites=72, n_years=24):
     
     return data
 
-def run_bayesian_model(data):
-    # Data for species presence and pesticide exposure
-    y_species_1 = data['bombus_presence'].values
-    y_species_2 = data['apis_presence'].values
-    y_species_3 = data['solitary_presence'].values
+# Observed presence columns (one per species) and occupancy covariates
+SPECIES_COLUMNS = ('bombus_presence', 'apis_presence', 'solitary_presence')
+COVARIATES = ('pesticide_exposure', 'survey_year', 'habitat')
+
+def standardize(data, columns):
+    """
+    Return a copy of data with columns scaled to zero mean and unit standard
+    deviation, and the {column: (mean, std)} used (e.g. to rescale betas)
+    """
+    data = data.copy()
+    scales = {}
+    for column in columns:
+        mean, std = data[column].mean(), data[column].std()
+        std = std if std > 0 else 1.0
+        data[column] = (data[column] - mean) / std
+        scales[column] = (mean, std)
+    return data, scales
 
-    X_neonic = data['pesticide_exposure'].values
-    X_year = data['survey_year'].values
-    X_habitat = np.random.uniform(0, 1, size=data.shape[0])
+def occupancy_inputs(data, species=SPECIES_COLUMNS, covariates=COVARIATES):
+    """ data containers and the observation / site coordinates of the occupancy model
+    """
+    site_idx, sites = pd.factorize(data['site_id'])
+    inputs = {
+        'X': data[list(covariates)].values.astype(float),
+        'site_idx': site_idx,
+        'y': data[list(species)].values
+    }
+    return inputs, {'site': sites, 'obs': data.index}
 
-    site_ids = data['site_id'].values
+def minibatch(*inputs, observed, batch_size):
+    """ the same random rows of every input and of the 0/1 observations, for
+    a likelihood scaled up to all rows with total_size (observations as int32,
+    minibatched int64 observations are cast and rejected)
+    """
+    return pm.Minibatch(*inputs, observed.astype('int32'), batch_size=batch_size)
+
+def build_occupancy_model(data, species=SPECIES_COLUMNS, covariates=COVARIATES, centered=False, batch_size=None):
+    """
+    Multi-species occupancy model with coefficient arrays indexed by species:
+    logit(psi[i, s]) = intercept[s] + X[i] @ beta[:, s] + site_effect[site[i], s]
+    for any number of species (presence columns) and covariates.
+    With centered=False the betas are sigma * standard normal offsets
+    (non-centered), which avoids the funnel between sigma and the betas.
+    The observations are data containers, see cached_occupancy_model, or
+    with batch_size random minibatches of rows for ADVI (see fit_advi).
+    """
+    inputs, coords = occupancy_inputs(data, species, covariates)
+    coords.update(species=list(species), covariate=list(covariates))
+    with pm.Model(coords=coords) as model:
+        if batch_size is None:
+            X = pm.Data('X', inputs['X'], dims=('obs', 'covariate'))
+            site_idx = pm.Data('site_idx', inputs['site_idx'], dims='obs')
+            y = pm.Data('y', inputs['y'], dims=('obs', 'species'))
+            obs_dims, total_size = ('obs', 'species'), None
+        else:
+            X, site_idx, y = minibatch(inputs['X'], inputs['site_idx'], observed=inputs['y'], batch_size=batch_size)
+            obs_dims, total_size = None, len(data)
 
-    with pm.Model() as model:
         # Priors
         sigma = pm.HalfNormal('sigma', sigma=1)
+        if centered:
+            beta_intercept = pm.Normal('beta_intercept', mu=0, sigma=sigma, dims='species')
+            beta = pm.Normal('beta', mu=0, sigma=sigma, dims=('covariate', 'species'))
+        else:
+            intercept_offset = pm.Normal('intercept_offset', mu=0, sigma=1, dims='species')
+            beta_offset = pm.Normal('beta_offset', mu=0, sigma=1, dims=('covariate', 'species'))
+            beta_intercept = pm.Deterministic('beta_intercept', sigma * intercept_offset, dims='species')
+            beta = pm.Deterministic('beta', sigma * beta_offset, dims=('covariate', 'species'))
+
+        # Random effects for site_id (accounting for the fact that we have repeated measures)
+        site_effect = pm.Normal('site_effect', mu=0, sigma=1, dims=('site', 'species'))
 
-        # Coefficients for each species
-        beta_intercept_1 = pm.Normal('beta_intercept_1', mu=0, sigma=sigma)
-        beta_neonic_1 = pm.Normal('beta_neonic_1', mu=0, sigma=sigma)
-        beta_year_1 = pm.Normal('beta_year_1', mu=0, sigma=sigma)
-        beta_habitat_1 = pm.Normal('beta_habitat_1', mu=0, sigma=sigma)
+        # Linear model for every observation and species at once
+        mu_occupancy = beta_intercept + pm.math.dot(X, beta) + site_effect[site_idx]
 
-        # Same for other species
-        beta_intercept_2 = pm.Normal('beta_intercept_2', mu=0, sigma=sigma)
-        beta_neonic_2 = pm.Normal('beta_neonic_2', mu=0, sigma=sigma)
-        beta_year_2 = pm.Normal('beta_year_2', mu=0, sigma=sigma)
-        beta_habitat_2 = pm.Normal('beta_habitat_2', mu=0, sigma=sigma)
+        # Likelihood (Bernoulli distribution on the logit scale)
+        pm.Bernoulli('y_obs', logit_p=mu_occupancy, observed=y, dims=obs_dims, total_size=total_size)
+    return model
 
-        beta_intercept_3 = pm.Normal('beta_intercept_3', mu=0, sigma=sigma)
-        beta_neonic_3 = pm.Normal('beta_neonic_3', mu=0, sigma=sigma)
-        beta_year_3 = pm.Normal('beta_year_3', mu=0, sigma=sigma)
-        beta_habitat_3 = pm.Normal('beta_habitat_3', mu=0, sigma=sigma)
+# Compiled models and their NUTS steps, keyed by structure and data shape
+_MODEL_CACHE = {}
 
-        # Random effects for site_id (accounting for the fact that we have repeated measures)
-        site_effect_1 = pm.Normal('site_effect_1', mu=0, sigma=1, shape=len(np.unique(site_ids)))
-        site_effect_2 = pm.Normal('site_effect_2', mu=0, sigma=1, shape=len(np.unique(site_ids)))
-        site_effect_3 = pm.Normal('site_effect_3', mu=0, sigma=1, shape=len(np.unique(site_ids)))
+def cached_occupancy_model(data, species=SPECIES_COLUMNS, covariates=COVARIATES, centered=False, target_accept=0.95):
+    """
+    Return (model, NUTS step) for data, building and compiling them only for a
+    new structure or data shape; otherwise the cached model gets the new
+    observations (new seeds, bootstrap resamples, region subsets with as many
+    rows and sites) and pm.sample(step=step) reuses the compiled step
+    """
+    inputs, coords = occupancy_inputs(data, species, covariates)
+    key = (tuple(species), tuple(covariates), centered, target_accept, inputs['y'].shape, len(coords['site']))
+    if key not in _MODEL_CACHE:
+        model = build_occupancy_model(data, species, covariates, centered)
+        _MODEL_CACHE[key] = (model, pm.NUTS(model=model, target_accept=target_accept))
+    model, step = _MODEL_CACHE[key]
+    pm.set_data(inputs, model=model, coords=coords)
+    return model, step
+
+def sampling_speed(trace, var_names=None):
+    """ sampling time (s), smallest bulk effective sample size over var_names
+    and effective samples per second
+    """
+    seconds = trace.posterior.attrs['sampling_time']
+    ess = az.ess(trace, var_names=var_names).to_array().min().item()
+    return {'sampling_time': seconds, 'ess_bulk_min': ess, 'ess_per_second': ess / seconds}
+
+class LossPlateau:
+    """
+    pm.fit callback stopping the fit once the mean loss of the last window
+    iterations changed by less than tolerance (relative) from the window
+    before; minibatch losses are too noisy to compare single iterations
+    """
+    def __init__(self, window=1000, tolerance=1e-3):
+        self.window = window
+        self.tolerance = tolerance
 
-        # Linear models
-        mu_occupancy_1 = (beta_intercept_1 + beta_neonic_1 * X_neonic + beta_year_1 * X_year + 
-                           beta_habitat_1 * X_habitat + site_effect_1[site_ids - 1])
+    def __call__(self, approx, losses, i):
+        if i % self.window or i < 2 * self.window:
+            return
+        last = np.mean(losses[-self.window:])
+        previous = np.mean(losses[-2 * self.window:-self.window])
+        if abs(previous - last) <= self.tolerance * abs(last):
+            raise StopIteration(f'loss converged after {i} iterations')
 
-        mu_occupancy_2 = (beta_intercept_2 + beta_neonic_2 * X_neonic + beta_year_2 * X_year + 
-                           beta_habitat_2 * X_habitat + site_effect_2[site_ids - 1])
+def fit_advi(model, n=50000, tolerance=1e-3, learning_rate=1e-2, random_seed=None):
+    """
+    Mean-field ADVI for up to n iterations, stopped early by LossPlateau.
+    Returns the approximation and a report with the fit time, the iterations
+    run, whether it converged and the mean loss of the last 1000 iterations.
+    """
+    start = time.perf_counter()
+    with model:
+        approx = pm.fit(n, method='advi', obj_optimizer=pm.adam(learning_rate=learning_rate), random_seed=random_seed,
+                        callbacks=[LossPlateau(tolerance=tolerance)])
+    iterations = len(approx.hist)
+    report = {'seconds': time.perf_counter() - start, 'iterations': iterations, 'converged': iterations < n,
+              'loss': np.mean(approx.hist[-1000:])}
+    return approx, report
 
-        mu_occupancy_3 = (beta_intercept_3 + beta_neonic_3 * X_neonic + beta_year_3 * X_year + 
-                           beta_habitat_3 * X_habitat + site_effect_3[site_ids - 1])
+def report_advi(approx, report):
+    """ print the fit_advi report and plot the loss history for convergence monitoring
+    """
+    status = 'converged' if report['converged'] else 'did not converge'
+    print(f"ADVI {status} after {report['iterations']} iterations in {report['seconds']:.1f} s "
+          f"(loss {report['loss']:.3f})")
+    plt.plot(approx.hist)
+    plt.xlabel('iteration')
+    plt.ylabel('loss (negative ELBO)')
+    plt.show()
+
+def compare_posteriors(traces, var_names=None):
+    """ posterior mean and sd of var_names side by side for {method: trace}
+    """
+    columns = {}
+    for method, trace in traces.items():
+        stats = az.summary(trace, var_names=var_names, kind='stats')
+        columns[f'{method}_mean'] = stats['mean']
+        columns[f'{method}_sd'] = stats['sd']
+    return pd.DataFrame(columns)
 
-        # Logistic regression for species presence
-        occupancy_prob_1 = pm.math.sigmoid(mu_occupancy_1)
-        occupancy_prob_2 = pm.math.sigmoid(mu_occupancy_2)
-        occupancy_prob_3 = pm.math.sigmoid(mu_occupancy_3)
+def prepare_data(data, covariates=COVARIATES, scale=True):
+    if 'habitat' in covariates and 'habitat' not in data:
+        data = data.assign(habitat=np.random.uniform(0, 1, size=data.shape[0]))
+    if scale:
+        # raw survey years (2000-2023) make the posterior badly conditioned
+        data, _ = standardize(data, covariates)
+    return data
 
-        # Likelihood (Bernoulli distribution)
-        y_obs_1 = pm.Bernoulli('y_obs_1', p=occupancy_prob_1, observed=y_species_1)
-        y_obs_2 = pm.Bernoulli('y_obs_2', p=occupancy_prob_2, observed=y_species_2)
-        y_obs_3 = pm.Bernoulli('y_obs_3', p=occupancy_prob_3, observed=y_species_3)
+def run_bayesian_model(data, species=SPECIES_COLUMNS, covariates=COVARIATES, draws=2000, target_accept=0.95,
+                       scale=True, centered=False):
+    data = prepare_data(data, covariates, scale)
 
+    model, step = cached_occupancy_model(data, species, covariates, centered, target_accept)
+    with model:
         # Sampling
-        trace = pm.sample(2000, return_inferencedata=False, target_accept=0.95)
+        trace = pm.sample(draws, step=step)
+
+    var_names = ['sigma', 'beta_intercept', 'beta']
+    speed = sampling_speed(trace, var_names)
+    print(f"sampling took {speed['sampling_time']:.1f} s, min bulk ESS {speed['ess_bulk_min']:.0f} "
+          f"({speed['ess_per_second']:.1f} ESS/s)")
 
-    # Plot trace using ArviZ (no need to convert to InferenceData in PyMC4)
-    az.plot_trace(trace)
+    # Plot trace using ArviZ
+    az.plot_trace(trace, var_names=var_names)
     plt.show()
 
-    # Return summary statistics
-    summary = az.summary(trace)
+    # Return summary statistics (betas per standard deviation of the covariate when scaled)
+    summary = az.summary(trace, var_names=var_names)
     return summary
+
+def run_variational_model(data, species=SPECIES_COLUMNS, covariates=COVARIATES, batch_size=500, n=50000,
+                          tolerance=1e-3, draws=2000, scale=True, compare=False):
+    """
+    Fit the occupancy model by minibatch ADVI, for data too large for NUTS.
+    With compare the same data is also sampled by NUTS and the posterior
+    means and sds of both are returned side by side.
+    """
+    data = prepare_data(data, covariates, scale)
+    model = build_occupancy_model(data, species, covariates, batch_size=min(batch_size, len(data)))
+    approx, report = fit_advi(model, n, tolerance)
+    report_advi(approx, report)
+
+    var_names = ['sigma', 'beta_intercept', 'beta']
+    trace = approx.sample(draws)
+    if not compare:
+        return az.summary(trace, var_names=var_names, kind='stats')
+
+    model, step = cached_occupancy_model(data, species, covariates)
+    start = time.perf_counter()
+    with model:
+        nuts_trace = pm.sample(step=step)
+    print(f'NUTS took {time.perf_counter() - start:.1f} s')
+    return compare_posteriors({'advi': trace, 'nuts': nuts_trace}, var_names)
     
 def main():
+    parser = argparse.ArgumentParser(description='Multi-species occupancy model on simulated survey data')
+    parser.add_argument('--advi', action='store_true', help='fit by minibatch ADVI instead of NUTS')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--compare', action='store_true', help='with --advi, also sample by NUTS and compare')
+    args = parser.parse_args()
+
     data = generate_fake_data()
-    summary = run_bayesian_model(data)
-    print(summary)
+    if args.advi:
+        summary = run_variational_model(data, batch_size=args.batch_size, compare=args.compare)
+    else:
+        summary = run_bayesian_model(data)
+    print(summary.to_string())
 
 if __name__ == "__main__":
     main()
@@ -1,42 +1,194 @@
+import argparse
+import importlib.util
+import os
+import time
+
 import pymc as pm
 import numpy as np
 import pandas as pd
 import arviz as az
+import matplotlib.pyplot as plt
+
+from format_data_code import compare_posteriors, fit_advi, minibatch, report_advi
+
+# NUTS implementations accepted by pm.sample, each named after the package it needs
+# (pymc is the default C backend, nutpie is numba-compiled, numpyro and blackjax run on JAX)
+NUTS_SAMPLERS = ('pymc', 'nutpie', 'numpyro', 'blackjax')
+
+def available_samplers():
+    return [name for name in NUTS_SAMPLERS if importlib.util.find_spec(name) is not None]
 
-def run_model():
+def load_data(path="formatteddata.csv"):
     # Load and clean the dataset
-    df = pd.read_csv("formatteddata.csv")  
+    df = pd.read_csv(path)
 
     # Encode species as categorical variable
     df["species_id"] = pd.Categorical(df["species"]).codes  
 
     # Standardize predictor
     df["pesticide_intensity_scaled"] = (df["avg_intensity_kg_per_ha"] - df["avg_intensity_kg_per_ha"].mean()) / df["avg_intensity_kg_per_ha"].std()
+    return df
 
-    num_species = df["species_id"].nunique()  # Number of unique species
+def model_inputs(df):
+    # data containers of the occupancy model
+    return {
+        "pesticide": df["pesticide_intensity_scaled"].values,
+        "region_idx": pd.factorize(df["region"])[0],  # Convert regions to integer labels
+        "occupancy": df["occupancy"].values
+    }
+
+def build_model(df, batch_size=None):
+    """ occupancy model on data containers (see cached_model), or with
+    batch_size on random minibatches of rows for ADVI
+    """
+    inputs = model_inputs(df)
 
     # Bayesian Multi-Species Occupancy Model
     with pm.Model() as occupancy_model:
+        if batch_size is None:
+            pesticide = pm.Data("pesticide", inputs["pesticide"])
+            region_idx = pm.Data("region_idx", inputs["region_idx"])
+            occupancy = pm.Data("occupancy", inputs["occupancy"])
+            total_size = None
+        else:
+            pesticide, region_idx, occupancy = minibatch(inputs["pesticide"], inputs["region_idx"],
+                                                         observed=inputs["occupancy"], batch_size=batch_size)
+            total_size = len(df)
+
         beta_0 = pm.Normal("beta_0", mu=0, sigma=1)
         beta_1 = pm.Normal("beta_1", mu=0, sigma=1)
 
         # If 'region' is categorical, use an index-based prior
-        region_idx = pd.factorize(df["region"])[0]  # Convert regions to integer labels
-        beta_region = pm.Normal("beta_region", mu=0, sigma=1, shape=len(set(region_idx)))
+        beta_region = pm.Normal("beta_region", mu=0, sigma=1, shape=len(set(inputs["region_idx"])))
+
+        logit_psi = beta_0 + beta_1 * pesticide + beta_region[region_idx]
+        if batch_size is None:
+            psi = pm.Deterministic("psi", pm.math.sigmoid(logit_psi))
+            pm.Bernoulli("y_obs", p=psi, observed=occupancy)
+        else:
+            pm.Bernoulli("y_obs", logit_p=logit_psi, observed=occupancy, total_size=total_size)
+    return occupancy_model
 
-        logit_psi = beta_0 + beta_1 * df["pesticide_intensity_scaled"] + beta_region[region_idx]
-        psi = pm.Deterministic("psi", pm.math.sigmoid(logit_psi))
+# Compiled models (and NUTS steps per target_accept), keyed by data shape
+_MODEL_CACHE = {}
 
-        y_obs = pm.Bernoulli("y_obs", p=psi, observed=df["occupancy"])
-        trace = pm.sample(500, tune=200, chains=2, cores=1, target_accept=0.9)
+def cached_model(df, target_accept=0.9, step=True):
+    """
+    Return (model, NUTS step or None) for df, building the model only for a
+    new data shape (rows, regions) and compiling a NUTS step only once per
+    target_accept; a cached model gets the new observations of df
+    """
+    inputs = model_inputs(df)
+    key = (len(df), len(set(inputs["region_idx"])))
+    if key not in _MODEL_CACHE:
+        _MODEL_CACHE[key] = (build_model(df), {})
+    model, steps = _MODEL_CACHE[key]
+    pm.set_data(inputs, model=model)
+    if not step:
+        return model, None
+    if target_accept not in steps:
+        steps[target_accept] = pm.NUTS(model=model, target_accept=target_accept)
+    return model, steps[target_accept]
+
+def sample_model(model, draws=500, tune=200, chains=2, cores=1, nuts_sampler='pymc', target_accept=0.9,
+                 random_seed=None, step=None):
+    """
+    Sample with the chosen NUTS backend and report the wall time (including
+    compilation) and the effective samples per second of the slowest parameter.
+    A compiled step (see cached_model) is reused by the pymc backend.
+    """
+    if nuts_sampler not in available_samplers():
+        raise ValueError(f"NUTS sampler '{nuts_sampler}' is not installed, available: {available_samplers()}")
+    start = time.perf_counter()
+    with model:
+        if step is not None and nuts_sampler == 'pymc':
+            trace = pm.sample(draws, tune=tune, chains=chains, cores=cores, step=step, random_seed=random_seed)
+        else:
+            trace = pm.sample(draws, tune=tune, chains=chains, cores=cores, nuts_sampler=nuts_sampler,
+                              target_accept=target_accept, random_seed=random_seed)
+    seconds = time.perf_counter() - start
+    ess = az.ess(trace, var_names=["beta_0", "beta_1", "beta_region"]).to_array().min().item()
+    timing = {'sampler': nuts_sampler, 'chains': chains, 'cores': cores, 'seconds': seconds,
+              'ess_bulk_min': ess, 'ess_per_second': ess / seconds}
+    print(f"{nuts_sampler}: {chains} chains on {cores} cores in {seconds:.1f} s, "
+          f"min bulk ESS {ess:.0f} ({ess / seconds:.1f} ESS/s)")
+    return trace, timing
+
+def benchmark(df, samplers=None, **options):
+    """ sample the same model with every installed (or listed) backend and
+    return the timings, fastest (highest ESS/s) first
+    """
+    timings = []
+    for nuts_sampler in samplers or available_samplers():
+        model, step = cached_model(df, options.get('target_accept', 0.9), step=nuts_sampler == 'pymc')
+        timings.append(sample_model(model, nuts_sampler=nuts_sampler, step=step, **options)[1])
+    return sorted(timings, key=lambda timing: -timing['ess_per_second'])
+
+def run_model(path="formatteddata.csv", draws=500, tune=200, chains=2, cores=1, nuts_sampler='pymc',
+              all_cores=False):
+    df = load_data(path)
+    if all_cores:
+        # one chain per local core, all running in parallel
+        chains = cores = os.cpu_count()
+
+    model, step = cached_model(df, step=nuts_sampler == 'pymc')
+    trace, timing = sample_model(model, draws, tune, chains, cores, nuts_sampler, step=step)
 
     print(trace)
-    print(az.summary(trace))
+    print(az.summary(trace, var_names=["beta_0", "beta_1", "beta_region"]))
 
     # Model evaluation
-    az.plot_trace(trace)
+    az.plot_trace(trace, var_names=["beta_0", "beta_1", "beta_region"])
     plt.show()
-    print(az.summary(trace))
+    return trace, timing
+
+def run_variational(path="formatteddata.csv", batch_size=1000, n=50000, advi_draws=1000, compare=False,
+                    **sample_options):
+    """
+    Fit the occupancy model by minibatch ADVI (national-scale data) and draw
+    advi_draws from the approximation, with compare also by NUTS
+    (sample_model options: draws, tune, chains, cores, nuts_sampler, ...)
+    for a side by side posterior
+    """
+    df = load_data(path)
+    approx, report = fit_advi(build_model(df, batch_size=min(batch_size, len(df))), n)
+    report_advi(approx, report)
+
+    trace = approx.sample(advi_draws)
+    var_names = ["beta_0", "beta_1", "beta_region"]
+    if not compare:
+        print(az.summary(trace, var_names=var_names, kind='stats'))
+        return trace, report
+    nuts_sampler = sample_options.get('nuts_sampler', 'pymc')
+    model, step = cached_model(df, sample_options.get('target_accept', 0.9), step=nuts_sampler == 'pymc')
+    nuts_trace = sample_model(model, step=step, **sample_options)[0]
+    print(compare_posteriors({'advi': trace, 'nuts': nuts_trace}, var_names).to_string())
+    return trace, report
 
 if __name__ == '__main__':
-    run_model()
+    parser = argparse.ArgumentParser(description='Bayesian multi-species occupancy model')
+    parser.add_argument('--data', default='formatteddata.csv')
+    parser.add_argument('--draws', type=int, default=500)
+    parser.add_argument('--tune', type=int, default=200)
+    parser.add_argument('--chains', type=int, default=2)
+    parser.add_argument('--cores', type=int, default=1)
+    parser.add_argument('--sampler', default='pymc', choices=NUTS_SAMPLERS, help='NUTS backend')
+    parser.add_argument('--all-cores', action='store_true', help='run one chain per local core in parallel')
+    parser.add_argument('--benchmark', action='store_true', help='time every installed NUTS backend')
+    parser.add_argument('--advi', action='store_true', help='fit by minibatch ADVI instead of NUTS')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--advi-draws', type=int, default=1000, help='draws from the ADVI approximation')
+    parser.add_argument('--compare', action='store_true', help='with --advi, also sample by NUTS and compare')
+    args = parser.parse_args()
+
+    chains = cores = os.cpu_count() if args.all_cores else None
+    if args.advi:
+        run_variational(args.data, args.batch_size, advi_draws=args.advi_draws, compare=args.compare,
+                        draws=args.draws, tune=args.tune, chains=chains or args.chains, cores=cores or args.cores,
+                        nuts_sampler=args.sampler)
+    elif args.benchmark:
+        for timing in benchmark(load_data(args.data), draws=args.draws, tune=args.tune,
+                                chains=chains or args.chains, cores=cores or args.cores):
+            print(timing)
+    else:
+        run_model(args.data, args.draws, args.tune, args.chains, args.cores, args.sampler, args.all_cores)
@@ -0,0 +1,31 @@
+"""
+Reader of the species parameter registry (species_parameters.yaml) shared by
+the agent-based model (ABM new/agents/parameters.py) and the delay-difference
+model (Delay Difference Model/parameters.py).
+"""
+import copy
+from functools import lru_cache
+from pathlib import Path
+
+import yaml
+
+REGISTRY_PATH = Path(__file__).resolve().parent / 'species_parameters.yaml'
+
+# Species id order used to index the compiled arrays of both models, one per
+# agent class of the ABM (the registry must list exactly these species)
+SPECIES = ('honeybee', 'bumblebee', 'solitary')
+
+@lru_cache(maxsize=None)
+def _parse_registry(path):
+    with open(path) as file:
+        species = yaml.safe_load(file)['species']
+    if set(species) != set(SPECIES):
+        raise ValueError(f'{path} must define exactly the species {SPECIES}, got {tuple(species)}')
+    return species
+
+def read_registry(path=REGISTRY_PATH):
+    """
+    Return the 'species' mapping of the registry. The file is parsed once per
+    path; every call gets its own copy, so overrides can be merged into it.
+    """
+    return copy.deepcopy(_parse_registry(Path(path)))